@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+قياسات أداء مسار معالجة الصور
+Micro-benchmarks for the image hot path
+
+يقيس فك ترميز JPEG وتجهيز الصور قبل الإرسال وإعادة الترميز وتمرير الصور عبر
+مجمع العمليات، إضافة إلى المسار القديم (حفظ PNG ونسخ النتيجة إلى BytesIO)
+للمقارنة، على صور اصطناعية من 0.3 حتى 12 ميغابكسل.
+
+مثال:
+    python bench_images.py --json before.json
+    python bench_images.py --json after.json --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import tempfile
+from io import BytesIO
+
+# bot يتطلب هذه المتغيرات عند الاستيراد، والقياس لا يتصل بأي خدمة
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:BENCH")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+import PIL
+from PIL import Image
+
+import bot
+
+# أحجام الصور بالميغابكسل (نسبة 3:4 مثل صور الهواتف)
+DEFAULT_SIZES = "0.3,1,3,6,12"
+MAX_SIDE = 1024
+JPEG_QUALITY = bot.STAGING_JPEG_QUALITY
+
+def make_photo(megapixels: float, image_format: str = "JPEG", rotated: bool = True) -> bytes:
+    """صورة اصطناعية بتدرجات وضوضاء خفيفة، مع علامة اتجاه EXIF كما في صور الكاميرا"""
+    width = int((megapixels * 1_000_000 * 3 / 4) ** 0.5)
+    height = int(width * 4 / 3)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 24)
+    image = Image.merge("RGB", (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), noise))
+    buffer = BytesIO()
+    if image_format == "JPEG":
+        exif = Image.Exif()
+        if rotated:
+            exif[0x0112] = 6
+        image.save(buffer, format="JPEG", quality=92, exif=exif)
+    else:
+        image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+# ---------------------------------------------------------------------------
+# الحالات المقاسة: كل دالة تستقبل الصورة (أو مسارها) وتنفذ عملية واحدة
+# ---------------------------------------------------------------------------
+
+def bench_decode(ctx):
+    """فك ترميز JPEG كامل عبر Image.open"""
+    Image.open(BytesIO(ctx["jpeg"])).load()
+
+def bench_decode_draft(ctx):
+    """فك ترميز JPEG بدقة مخفضة (draft) كما في preprocess_photo"""
+    image = Image.open(BytesIO(ctx["jpeg"]))
+    image.draft("RGB", (MAX_SIDE, MAX_SIDE))
+    image.load()
+
+def bench_preprocess(ctx):
+    """preprocess_photo: اتجاه EXIF + تصغير + JPEG"""
+    bot.preprocess_photo(ctx["jpeg"], MAX_SIDE, JPEG_QUALITY)
+
+def bench_encode_jpeg(ctx):
+    """encode_jpeg لصورة PNG (صيغة غير مقبولة مباشرة)"""
+    bot.encode_jpeg(ctx["png"], JPEG_QUALITY)
+
+def bench_legacy_png_save(ctx):
+    """المسار القديم: فك الصورة كاملة وحفظها PNG قبل الإرسال"""
+    image = Image.open(BytesIO(ctx["jpeg"]))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+
+def bench_detect_format(ctx):
+    """تحديد الصيغة من البايتات الأولى دون فك الترميز"""
+    bot.ImageStaging.detect_format(ctx["jpeg"])
+
+def bench_result_read(ctx):
+    """المسار الحالي للنتيجة: قراءة بايتات الملف كما هي"""
+    with open(ctx["result_path"], "rb") as f:
+        f.read()
+
+def bench_legacy_result_bytesio(ctx):
+    """المسار القديم لـ generate_image: قراءة الملف كاملاً ونسخه إلى BytesIO"""
+    with open(ctx["result_path"], "rb") as f:
+        BytesIO(f.read())
+
+def bench_preprocess_pool(ctx):
+    """preprocess_photo عبر مجمع العمليات والذاكرة المشتركة (يشمل تكلفة النقل)"""
+    ctx["loop"].run_until_complete(
+        bot.image_process_pool.run(bot.preprocess_photo, ctx["jpeg"], MAX_SIDE, JPEG_QUALITY)
+    )
+
+BENCHMARKS = {
+    "decode": bench_decode,
+    "decode_draft": bench_decode_draft,
+    "preprocess": bench_preprocess,
+    "encode_jpeg": bench_encode_jpeg,
+    "legacy_png_save": bench_legacy_png_save,
+    "detect_format": bench_detect_format,
+    "result_read": bench_result_read,
+    "legacy_result_bytesio": bench_legacy_result_bytesio,
+    "preprocess_pool": bench_preprocess_pool,
+}
+
+def measure(func, ctx, repeat: int, min_time: float) -> dict:
+    """تشغيل الحالة مرة للتسخين ثم repeat مرة على الأقل حتى يمضي min_time"""
+    func(ctx)
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < repeat or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        func(ctx)
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return {
+        "iterations": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(0.95 * len(samples)))] * 1000,
+        "min_ms": samples[0] * 1000,
+        "stdev_ms": (statistics.stdev(samples) if len(samples) > 1 else 0.0) * 1000,
+    }
+
+def run(sizes, names, repeat: int, min_time: float) -> dict:
+    loop = asyncio.new_event_loop()
+    workdir = tempfile.mkdtemp(prefix="graffiti_bench_")
+    results = {}
+    try:
+        for megapixels in sizes:
+            jpeg = make_photo(megapixels)
+            result_path = os.path.join(workdir, f"result_{megapixels:g}.webp")
+            Image.open(BytesIO(jpeg)).save(result_path, format="WEBP")
+            ctx = {
+                "jpeg": jpeg,
+                "png": make_photo(megapixels, "PNG"),
+                "result_path": result_path,
+                "loop": loop,
+            }
+            label = f"{megapixels:g}MP"
+            results[label] = {"input_bytes": len(jpeg)}
+            for name in names:
+                stats = measure(BENCHMARKS[name], ctx, repeat, min_time)
+                results[label][name] = stats
+                print(f"{label:>7} {name:<24}{stats['median_ms']:>10.2f} ms  (p95 {stats['p95_ms']:.2f}, n={stats['iterations']})")
+    finally:
+        bot.image_process_pool.shutdown()
+        loop.close()
+    return results
+
+def compare(baseline: dict, current: dict):
+    """مقارنة الوسيط مع تقرير سابق (القيم السالبة تعني تحسناً)"""
+    print("-" * 64)
+    print(f"{'size':>7} {'benchmark':<24}{'before':>10}{'after':>10}{'change':>10}")
+    for label, benches in current["results"].items():
+        old_benches = baseline.get("results", {}).get(label, {})
+        for name, stats in benches.items():
+            old = old_benches.get(name)
+            if not isinstance(stats, dict) or not isinstance(old, dict):
+                continue
+            change = (stats["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0.0
+            print(f"{label:>7} {name:<24}{old['median_ms']:>10.2f}{stats['median_ms']:>10.2f}{change:>+9.1f}%")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Image hot path micro-benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated megapixel sizes")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS), help="comma separated benchmark names")
+    parser.add_argument("--repeat", type=int, default=10, help="minimum timed iterations per case")
+    parser.add_argument("--min-time", type=float, default=0.5, help="minimum timed seconds per case")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [float(size) for size in args.sizes.split(",")]
+    names = [name.strip() for name in args.benchmarks.split(",")]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"حالات غير معروفة: {', '.join(unknown)} (المتاح: {', '.join(BENCHMARKS)})")
+
+    report = {
+        "machine": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {"max_side": MAX_SIDE, "jpeg_quality": JPEG_QUALITY, "repeat": args.repeat, "min_time": args.min_time},
+        "results": run(sizes, names, args.repeat, args.min_time),
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
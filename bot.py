@@ -1,14 +1,37 @@
 
 
+import time
+# بداية تحميل البوت، لقياس زمن بدء التشغيل
+STARTUP_STARTED = time.perf_counter()
+
 import os
 import logging
 import asyncio
 import tempfile
-import aiohttp
 import re
+import hashlib
+import functools
+import threading
+import sqlite3
+import sys
+import json
+import contextlib
+import multiprocessing
+from aiohttp import ClientTimeout
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+import io
 from io import BytesIO
-from PIL import Image
-
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+from telegram.ext import BaseUpdateProcessor
+from dotenv import load_dotenv
+from http_client import SharedHttpSession
+import metrics
 
 # تحميل متغيرات البيئة
 load_dotenv()
@@ -20,308 +43,1723 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# حل مشكلة handle_file على Railway ومنصات النشر السحابية
-try:
-    from gradio_client import handle_file
-    logger.info("✅ تم استيراد handle_file بنجاح")
-except ImportError:
-    # Fallback للإصدارات الأقدم أو عندما handle_file غير متوفر
-    def handle_file(file_path):
-        """Fallback function when handle_file is not available"""
-        logger.warning("⚠️ استخدام fallback لـ handle_file")
-        return file_path
-    logger.info("⚠️ استخدام fallback لـ handle_file")
-except Exception as e:
-    # حل إضافي للأخطاء غير المتوقعة
-    def handle_file(file_path):
-        """Emergency fallback function"""
-        logger.error(f"❌ خطأ في handle_file: {e}")
-        return file_path
-    logger.error(f"❌ خطأ في استيراد handle_file: {e}")
+# المكتبات الثقيلة (gradio_client و google.generativeai و PIL) تُستورد عند أول استخدام
+# أو في مهام التسخين بعد بدء الاستقبال، حتى يرد البوت على /start فور تشغيله
+Client = None
+_handle_file = None
+
+def create_gradio_client(client_id: str):
+    """إنشاء عميل Gradio مع استيراد gradio_client عند أول اتصال (دالة حاجبة)"""
+    global Client
+    if Client is None:
+        from gradio_client import Client
+    return Client(client_id)
+
+def handle_file(file_path):
+    """تغليف مسار الملف لـ Gradio، مع بديل للإصدارات التي لا توفر handle_file"""
+    global _handle_file
+    if _handle_file is None:
+        # حل مشكلة handle_file على Railway ومنصات النشر السحابية
+        try:
+            from gradio_client import handle_file as _handle_file
+            logger.info("✅ تم استيراد handle_file بنجاح")
+        except ImportError:
+            # Fallback للإصدارات الأقدم أو عندما handle_file غير متوفر
+            logger.warning("⚠️ استخدام fallback لـ handle_file")
+            _handle_file = lambda path: path
+        except Exception as e:
+            # حل إضافي للأخطاء غير المتوقعة
+            logger.error(f"❌ خطأ في استيراد handle_file: {e}")
+            _handle_file = lambda path: path
+    return _handle_file(file_path)
 
 # الحصول على توكن التليجرام
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 # الحصول على مفتاح Gemini AI
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
+# عنوان Bot API بديل (خادم Bot API محلي أو خادم اختبار)، الافتراضي هو خوادم تليجرام
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+TELEGRAM_FILE_URL = os.getenv('TELEGRAM_FILE_URL')
+
+# وضع الاستقبال: polling (الافتراضي) أو webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# الرابط العام للخادم (مثلاً https://my-bot.up.railway.app) والمسار الذي يستقبل التحديثات
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+# الرمز السري الذي يرسله تليجرام في ترويسة كل تحديث (إلزامي في وضع webhook)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('PORT', '8080'))
+# عدد الاتصالات المتزامنة التي يفتحها تليجرام لإرسال التحديثات
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# عدد التحديثات التي تُعالج بالتوازي (تحديثات المحادثة الواحدة تبقى بالترتيب)
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))
+
 if not TELEGRAM_TOKEN:
     raise ValueError("❌ TELEGRAM_TOKEN مطلوب في ملف .env")
 
 if not GEMINI_API_KEY:
     raise ValueError("❌ GEMINI_API_KEY مطلوب في ملف .env")
 
-# إعداد Gemini AI
-genai.configure(api_key=GEMINI_API_KEY)
+# نموذج Gemini يُنشأ في الخلفية بعد بدء التشغيل (أو عند أول ترجمة)
+gemini_model = None
+_gemini_initialized = False
+_gemini_lock = threading.Lock()
 
-# إنشاء نموذج Gemini 2.0 Flash
-try:
-    gemini_model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    logger.info("✅ تم الاتصال بنموذج Gemini 2.0 Flash بنجاح")
-except Exception as e:
-    logger.error(f"❌ خطأ في إعداد Gemini: {e}")
-    # Fallback إلى نموذج آخر
-    try:
-        gemini_model = genai.GenerativeModel('gemini-pro')
-        logger.info("✅ تم الاتصال بنموذج Gemini Pro البديل")
-    except Exception as e2:
-        logger.error(f"❌ فشل في إعداد جميع نماذج Gemini: {e2}")
-        gemini_model = None
+def init_gemini():
+    """إعداد Gemini AI وإنشاء النموذج (دالة حاجبة تستورد google.generativeai)"""
+    global gemini_model, _gemini_initialized
+    with _gemini_lock:
+        if _gemini_initialized:
+            return gemini_model
+        try:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+        except Exception as e:
+            logger.error(f"❌ خطأ في إعداد Gemini: {e}")
+            _gemini_initialized = True
+            return gemini_model
+        
+        # إنشاء نموذج Gemini 2.0 Flash
+        try:
+            gemini_model = genai.GenerativeModel('gemini-2.0-flash-exp')
+            logger.info("✅ تم الاتصال بنموذج Gemini 2.0 Flash بنجاح")
+        except Exception as e:
+            logger.error(f"❌ خطأ في إعداد Gemini: {e}")
+            # Fallback إلى نموذج آخر
+            try:
+                gemini_model = genai.GenerativeModel('gemini-pro')
+                logger.info("✅ تم الاتصال بنموذج Gemini Pro البديل")
+            except Exception as e2:
+                logger.error(f"❌ فشل في إعداد جميع نماذج Gemini: {e2}")
+                gemini_model = None
+        _gemini_initialized = True
+        return gemini_model
+
+async def get_gemini_model():
+    """إرجاع نموذج Gemini، مع إعداده في خيط منفصل إن لم يكتمل التسخين بعد"""
+    if gemini_model is not None or _gemini_initialized:
+        return gemini_model
+    return await asyncio.to_thread(init_gemini)
+
+# محولات المعاملات: تحويل مدخلات الطلب إلى (args, kwargs) بالصيغة التي يتوقعها كل Space
+def tryon_keyword_args(person_path: str, garment_path: str, garment_type: str):
+    """صورة الشخص والملابس كمعاملات بالاسم (person_image / clothing_image)"""
+    return (), {
+        "person_image": handle_file(person_path),
+        "clothing_image": handle_file(garment_path)
+    }
 
-# نماذج الذكاء الاصطناعي المتاحة
+def tryon_positional_args(person_path: str, garment_path: str, garment_type: str):
+    """صورة الشخص والملابس ونوع الملابس كمعاملات بالترتيب"""
+    return (handle_file(person_path), handle_file(garment_path), garment_type), {}
+
+def flux_generation_args(prompt: str, width: int, height: int):
+    """معاملات توليد الصور لنموذج FLUX"""
+    return (), {
+        "prompt": prompt,
+        "seed": 0,
+        "randomize_seed": True,
+        "width": width,
+        "height": height,
+        "guidance_scale": 3.5,
+        "num_inference_steps": 28
+    }
+
+# سجل نماذج الذكاء الاصطناعي: إضافة نموذج جديد تحتاج إلى مدخل هنا فقط
+# adapter: محول المعاملات، garment_types: أنواع الملابس المدعومة،
+# timeout: المهلة القصوى للطلب (بالثواني)، fallbacks: البدائل بالترتيب عند الفشل
 AI_MODELS = {
     "g1_fast": {
         "name": "Graffiti G1 Fast",
+        "button": "🔥 Graffiti G1 Fast",
         "client_id": "krsatyam7/Virtual_Clothing_Try-On-new",
         "api_endpoint": "/swap_clothing",
-        "description": "نموذج سريع ومحسن للاستخدام اليومي"
+        "description": "نموذج سريع ومحسن للاستخدام اليومي",
+        # مزايا النموذج كما تظهر في قائمة الاختيار
+        "features": ("معالجة سريعة ومحسنة", "مناسب للاستخدام اليومي", "نتائج عالية الجودة"),
+        "adapter": tryon_keyword_args,
+        "garment_types": ("upper_body",),
+        "fallbacks": ("g1_pro",),
+        "timeout": float(os.getenv('G1_FAST_TIMEOUT', '120')),
+        "max_concurrency": int(os.getenv('G1_FAST_CONCURRENCY', '4')),
+        "workers": int(os.getenv('G1_FAST_WORKERS', '4')),
+        # أكبر بُعد للصورة قبل الإرسال (النموذج يعمل بدقة داخلية أصغر)
+        "max_side": int(os.getenv('G1_FAST_MAX_SIDE', '1024')),
+        # صيغ الصور التي يقبلها النموذج كما هي دون إعادة ترميز
+        "input_formats": ("JPEG", "PNG", "WEBP")
     },
     "g1_pro": {
         "name": "Graffiti G1 Pro", 
+        "button": "🚀 Graffiti G1 Pro",
         "client_id": "PawanratRung/virtual-try-on",
         "api_endpoint": "/virtual_tryon",
-        "description": "نموذج متقدم مع خيارات متنوعة للملابس"
+        "description": "نموذج متقدم مع خيارات متنوعة للملابس",
+        # مزايا النموذج كما تظهر في قائمة الاختيار
+        "features": ("نموذج متقدم ومتطور", "دعم أنواع ملابس متعددة", "دقة عالية جداً", "خيارات تخصيص أكثر"),
+        "adapter": tryon_positional_args,
+        "garment_types": ("upper_body", "lower_body", "dresses"),
+        "fallbacks": ("g1_fast",),
+        "timeout": float(os.getenv('G1_PRO_TIMEOUT', '180')),
+        "max_concurrency": int(os.getenv('G1_PRO_CONCURRENCY', '4')),
+        "workers": int(os.getenv('G1_PRO_WORKERS', '4')),
+        # أكبر بُعد للصورة قبل الإرسال (النموذج يعمل بدقة داخلية أصغر)
+        "max_side": int(os.getenv('G1_PRO_MAX_SIDE', '1024')),
+        # صيغ الصور التي يقبلها النموذج كما هي دون إعادة ترميز
+        "input_formats": ("JPEG", "PNG", "WEBP")
     },
     "g1_image": {
         "name": "Graffiti G1-Image Generator",
         "client_id": "black-forest-labs/FLUX.1-dev",
         "api_endpoint": "/infer",
-        "description": "مولد صور ذكي بالذكاء الاصطناعي"
+        "description": "مولد صور ذكي بالذكاء الاصطناعي",
+        "adapter": flux_generation_args,
+        "fallbacks": (),
+        "timeout": float(os.getenv('G1_IMAGE_TIMEOUT', '180')),
+        "max_concurrency": int(os.getenv('G1_IMAGE_CONCURRENCY', '2')),
+        "workers": int(os.getenv('G1_IMAGE_WORKERS', '2'))
     }
 }
 
-# أنواع الملابس للنموذج المتقدم
+# نماذج تجربة الملابس بالترتيب الذي تظهر به للمستخدم
+TRYON_MODELS = [model_key for model_key, model_info in AI_MODELS.items() if "garment_types" in model_info]
+
+# أنواع الملابس (تظهر لكل نموذج حسب garment_types في سجله)
 GARMENT_TYPES = {
-    "upper": {"id": "upper_body", "name": "ملابس علوية"},
-    "lower": {"id": "lower_body", "name": "ملابس سفلية"}, 
-    "dress": {"id": "dresses", "name": "فساتين"}
+    "upper": {"id": "upper_body", "name": "ملابس علوية", "button": "👕 ملابس علوية"},
+    "lower": {"id": "lower_body", "name": "ملابس سفلية", "button": "👖 ملابس سفلية"}, 
+    "dress": {"id": "dresses", "name": "فساتين", "button": "👗 فساتين"}
 }
 
-# حالات المستخدمين
-user_sessions = {}
+# مدة خمول الجلسة قبل حذفها (بالثواني) والميزانية الكلية لذاكرة الجلسات (بالبايت)
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', str(30 * 60)))
+SESSION_MEMORY_BUDGET = int(os.getenv('SESSION_MEMORY_BUDGET', str(8 * 1024 * 1024)))
+# مخزن الجلسات: memory (الافتراضي) أو sqlite أو redis لتشغيل عدة نسخ من البوت.
+# تنبيه: المشترك بين النسخ هو بيانات الجلسة فقط؛ حد المهمة الواحدة لكل مستخدم (JobScheduler)
+# وترتيب تحديثات المحادثة (ChatOrderedUpdateProcessor) والذاكرات المؤقتة تبقى داخل كل عملية،
+# لذا يجب توجيه تحديثات المستخدم الواحد إلى نفس النسخة (webhook واحد أو توزيع حسب المحادثة)
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory').lower()
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', os.path.join(tempfile.gettempdir(), 'graffiti_sessions.db'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 
-class GraffitiAI:
-    """فئة رئيسية لبوت Graffiti AI"""
+# الحد الأقصى لحجم صورة تليجرام المقبولة (بالبايت)
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(10 * 1024 * 1024)))
+# سعة ذاكرة الصور المحملة مؤقتاً (بالبايت)
+DOWNLOAD_CACHE_BYTES = int(os.getenv('DOWNLOAD_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+# إعدادات ذاكرة نتائج تجربة الملابس
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'graffiti_results'))
+RESULT_CACHE_MEMORY_BYTES = int(os.getenv('RESULT_CACHE_MEMORY_BYTES', str(32 * 1024 * 1024)))
+RESULT_CACHE_DISK_BYTES = int(os.getenv('RESULT_CACHE_DISK_BYTES', str(512 * 1024 * 1024)))
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', str(24 * 60 * 60)))
+
+# عدد معرفات file_id المحفوظة للصور المرسلة سابقاً
+FILE_ID_CACHE_SIZE = int(os.getenv('FILE_ID_CACHE_SIZE', '10000'))
+
+# إعدادات ذاكرة الترجمات (اترك TRANSLATION_CACHE_DB فارغاً لتعطيل الحفظ الدائم)
+TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', '2000'))
+TRANSLATION_CACHE_TTL = int(os.getenv('TRANSLATION_CACHE_TTL', str(30 * 24 * 60 * 60)))
+TRANSLATION_CACHE_DB = os.getenv('TRANSLATION_CACHE_DB', os.path.join(tempfile.gettempdir(), 'graffiti_translations.db'))
+
+# الحد الأقصى للمهام المنتظرة لكل نموذج
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '50'))
+# أقل فاصل بين تحديثين لرسالة الترتيب في الطابور لنفس المستخدم (بالثواني)
+QUEUE_POSITION_INTERVAL = float(os.getenv('QUEUE_POSITION_INTERVAL', '5'))
+
+# مجلد الملفات المؤقتة للصور المرسلة إلى Gradio (tmpfs في الذاكرة إن توفر)
+STAGING_DIR = os.getenv('STAGING_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+# جودة JPEG عند الحاجة لإعادة الترميز
+STAGING_JPEG_QUALITY = int(os.getenv('STAGING_JPEG_QUALITY', '90'))
+
+# عدد عمليات معالجة الصور (افتراضياً عدد أنوية المعالج)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', str(os.cpu_count() or 1)))
+# أقل مساحة تُحجز لناتج عامل الصور في الذاكرة المشتركة (بالبايت)
+IMAGE_OUTPUT_MIN_BYTES = int(os.getenv('IMAGE_OUTPUT_MIN_BYTES', str(4 * 1024 * 1024)))
+
+# حجم دفعات تحميل النتائج، والحد الذي يُنقل بعده الملف المؤقت من الذاكرة إلى القرص
+RESULT_CHUNK_BYTES = int(os.getenv('RESULT_CHUNK_BYTES', str(64 * 1024)))
+RESULT_SPOOL_BYTES = int(os.getenv('RESULT_SPOOL_BYTES', str(1024 * 1024)))
+
+# عدد الخيوط المخصصة لاستدعاءات Gradio المتزامنة (الحاجبة): مجموع حدود التزامن مع هامش
+# حتى لا تنتظر مهمة سمح بها حد النموذج خيطاً تحجزه نماذج أخرى
+PREDICT_WORKERS = int(os.getenv(
+    'PREDICT_WORKERS', str(sum(model_info.get("max_concurrency", 1) for model_info in AI_MODELS.values()) + 2)
+))
+# خيوط منفصلة لإنشاء عملاء Gradio (بطيء عند استيقاظ Space) حتى لا يزاحم الاستدعاءات
+CONNECT_WORKERS = int(os.getenv('CONNECT_WORKERS', str(len(AI_MODELS))))
+# الفاصل الزمني لفحص انتهاء مهام Gradio (بالثواني)
+PREDICT_POLL_INTERVAL = float(os.getenv('PREDICT_POLL_INTERVAL', '0.25'))
+
+# إعدادات قاطع الدائرة لكل نموذج
+BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '4'))
+BREAKER_ERROR_RATE = float(os.getenv('BREAKER_ERROR_RATE', '0.5'))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', '60'))
+
+# إبقاء Spaces المجانية مستيقظة: مدة الخمول قبل إرسال طلب خفيف، وتكرار الفحص (بالثواني)
+KEEPALIVE_ENABLED = os.getenv('KEEPALIVE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+KEEPALIVE_IDLE = float(os.getenv('KEEPALIVE_IDLE', str(15 * 60)))
+KEEPALIVE_CHECK_INTERVAL = float(os.getenv('KEEPALIVE_CHECK_INTERVAL', '60'))
+# أقل مدة بين طلبي إيقاظ لنفس النموذج عند دخول المستخدمين إلى مساره
+KEEPALIVE_WAKE_COOLDOWN = float(os.getenv('KEEPALIVE_WAKE_COOLDOWN', '60'))
+KEEPALIVE_TIMEOUT = float(os.getenv('KEEPALIVE_TIMEOUT', '15'))
+
+# إرسال نسخة احتياطية من طلب تجربة الملابس إلى أول بديل يدعم نوع الملابس إذا تأخر الأساسي
+TRYON_HEDGING = os.getenv('TRYON_HEDGING', 'false').lower() in ('1', 'true', 'yes')
+# النسبة المئوية لزمن استجابة النموذج الأساسي التي يُرسل بعدها الطلب الاحتياطي
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '0.9'))
+# مهلة الانتظار قبل الطلب الاحتياطي عند عدم توفر إحصائيات كافية (بالثواني)
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '30'))
+
+# مقاييس الأداء المعروضة على /metrics
+stage_seconds = metrics.registry.histogram(
+    "graffiti_stage_seconds", "Latency of each processing stage", ("stage",)
+)
+backend_seconds = metrics.registry.histogram(
+    "graffiti_backend_seconds", "Latency of AI backend predictions", ("backend", "outcome")
+)
+cache_requests = metrics.registry.counter(
+    "graffiti_cache_requests_total", "Cache lookups by cache and result", ("cache", "result")
+)
+fallbacks_total = metrics.registry.counter(
+    "graffiti_fallbacks_total", "Requests served by a backend other than the one selected", ("model", "backend")
+)
+hedges_total = metrics.registry.counter(
+    "graffiti_hedges_total", "Duplicate requests sent to a second backend", ("model", "backend")
+)
+failures_total = metrics.registry.counter(
+    "graffiti_failures_total", "Failed or skipped backend calls", ("backend", "reason")
+)
+queue_depth_gauge = metrics.registry.gauge(
+    "graffiti_queue_depth", "Jobs waiting per backend", ("backend",)
+)
+sessions_gauge = metrics.registry.gauge(
+    "graffiti_sessions", "Active user sessions"
+)
+breaker_state_gauge = metrics.registry.gauge(
+    "graffiti_breaker_open", "Circuit breaker state per backend (0 closed, 0.5 half-open, 1 open)", ("backend",)
+)
+keepalive_probes = metrics.registry.counter(
+    "graffiti_keepalive_probes_total", "Keep-alive and wake-up probes sent to Spaces", ("backend", "result")
+)
+startup_seconds = metrics.registry.gauge(
+    "graffiti_startup_seconds", "Seconds from loading bot.py until each startup phase completed", ("phase",)
+)
+
+def mark_startup(phase: str):
+    """تسجيل زمن اكتمال مرحلة من مراحل بدء التشغيل منذ بدء تحميل bot.py"""
+    elapsed = time.perf_counter() - STARTUP_STARTED
+    startup_seconds.set(round(elapsed, 3), phase=phase)
+    logger.info(f"⏱️ بدء التشغيل - {phase}: {elapsed:.2f} ثانية")
+
+class BackendUnavailable(Exception):
+    """النموذج معطل مؤقتاً حسب قاطع الدائرة"""
+
+class CircuitBreaker:
+    """قاطع دائرة لنموذج واحد مع نسبة أخطاء وزمن استجابة على نافذة متحركة"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str, window: int, min_calls: int, error_rate: float, cooldown: float):
+        self.name = name
+        self.min_calls = min_calls
+        self.max_error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        # كل عنصر (نجاح؟، زمن الاستجابة)
+        self._calls = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+    
+    def allow(self) -> bool:
+        """هل يُسمح بإرسال طلب الآن؟ بعد فترة التبريد يُسمح بطلب اختبار واحد"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+    
+    def release(self):
+        """إلغاء طلب الاختبار دون نتيجة (مثلاً عند إلغاء الطلب)"""
+        self._probe_in_flight = False
+    
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        logger.warning(f"🔌 تم إيقاف نموذج {self.name} مؤقتاً لمدة {self.cooldown:.0f} ثانية")
+    
+    def record_success(self, latency: float):
+        self._calls.append((True, latency))
+        if self.state == self.HALF_OPEN:
+            logger.info(f"✅ عاد نموذج {self.name} للعمل")
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+            self._calls.clear()
+            self._calls.append((True, latency))
+    
+    def record_failure(self, latency: float = 0.0):
+        self._calls.append((False, latency))
+        if self.state == self.HALF_OPEN:
+            self._open()
+        elif len(self._calls) >= self.min_calls and self.error_rate() >= self.max_error_rate:
+            self._open()
+    
+    def error_rate(self) -> float:
+        if not self._calls:
+            return 0.0
+        return sum(1 for ok, _ in self._calls if not ok) / len(self._calls)
+    
+    def latency_percentile(self, percentile: float):
+        """زمن الاستجابة للطلبات الناجحة عند النسبة المئوية المطلوبة (0-1)"""
+        latencies = sorted(latency for ok, latency in self._calls if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(percentile * len(latencies)))
+        return latencies[index]
+    
+    def health_score(self) -> float:
+        """درجة صحة بين 0 و1 تجمع نسبة النجاح وسرعة الاستجابة"""
+        if self.state == self.OPEN:
+            return 0.0
+        median = self.latency_percentile(0.5) or 0.0
+        return (1.0 - self.error_rate()) / (1.0 + median / 60.0)
+
+# قاطع دائرة لكل نموذج
+circuit_breakers = {
+    model_key: CircuitBreaker(
+        model_info["name"], BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_ERROR_RATE, BREAKER_COOLDOWN
+    )
+    for model_key, model_info in AI_MODELS.items()
+}
+
+class PredictExecutor:
+    """تشغيل استدعاءات Gradio الحاجبة خارج حلقة الأحداث مع حد تزامن لكل نموذج"""
+    
+    def __init__(self, max_workers: int, connect_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gradio")
+        self._connect_executor = ThreadPoolExecutor(max_workers=connect_workers, thread_name_prefix="gradio-connect")
+        self._semaphores = {}
+    
+    def _semaphore(self, model_key: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(model_key)
+        if semaphore is None:
+            limit = AI_MODELS[model_key].get("max_concurrency", 1)
+            semaphore = self._semaphores[model_key] = asyncio.Semaphore(limit)
+        return semaphore
+    
+    async def run(self, func, *args, **kwargs):
+        """تشغيل دالة حاجبة في مجمع الخيوط"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    async def connect(self, func, *args, **kwargs):
+        """إنشاء عميل Gradio في مجمع خيوط الاتصال المنفصل"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._connect_executor, functools.partial(func, *args, **kwargs))
     
     @staticmethod
-    async def create_ai_client(model_key: str):
-        """إنشاء عميل الذكاء الاصطناعي"""
-        try:
-            model_info = AI_MODELS[model_key]
-            # إنشاء العميل بدون timeout (غير مدعوم في هذا الإصدار)
-            client = Client(model_info["client_id"])
-            logger.info(f"✅ تم الاتصال بنموذج {model_info['name']}")
-            return client
-        except Exception as e:
-            logger.error(f"❌ خطأ في إنشاء العميل {AI_MODELS.get(model_key, {}).get('name', model_key)}: {e}")
-            # محاولة الاتصال بالنموذج البديل
+    async def _wait_job(job):
+        while not job.done():
+            await asyncio.sleep(PREDICT_POLL_INTERVAL)
+        # المهمة انتهت، فلا يحجز result() الحلقة
+        return job.result()
+    
+    async def predict(self, model_key: str, client, *args, **kwargs):
+        """تنفيذ client.predict ضمن حد التزامن والمهلة الخاصين بالنموذج مع تسجيل النتيجة في قاطع الدائرة"""
+        breaker = circuit_breakers[model_key]
+        async with self._semaphore(model_key):
+            started = time.monotonic()
+            job = None
             try:
-                if model_key == "g1_fast":
-                    # جرب النموذج البديل
-                    alt_client = Client("PawanratRung/virtual-try-on")
-                    logger.info("✅ تم الاتصال بالنموذج البديل G1 Pro")
-                    return alt_client
-                elif model_key == "g1_pro":
-                    # جرب النموذج البديل
-                    alt_client = Client("krsatyam7/Virtual_Clothing_Try-On-new")
-                    logger.info("✅ تم الاتصال بالنموذج البديل G1 Fast")
-                    return alt_client
-            except Exception as e2:
-                logger.error(f"❌ فشل في الاتصال بالنموذج البديل: {e2}")
-            return None
+                # submit بدل predict حتى يمكن إلغاء المهمة في طابور Space عند الإلغاء أو انتهاء المهلة
+                job = await self.run(client.submit, *args, **kwargs)
+                # انتظار النتيجة بالاستطلاع بدل حجز خيط في job.result()، لأن إلغاء مهمة
+                # قيد التشغيل لا يوقفها فيبقى الخيط محجوزاً بعد انتهاء المهلة
+                result = await asyncio.wait_for(self._wait_job(job), AI_MODELS[model_key].get("timeout"))
+            except asyncio.CancelledError:
+                breaker.release()
+                backend_seconds.observe(time.monotonic() - started, backend=model_key, outcome="cancelled")
+                if job is not None:
+                    job.cancel()
+                raise
+            except asyncio.TimeoutError:
+                # قد ترمي submit نفسها TimeoutError (مهلة الشبكة) قبل إنشاء المهمة
+                if job is not None:
+                    job.cancel()
+                breaker.record_failure(time.monotonic() - started)
+                backend_seconds.observe(time.monotonic() - started, backend=model_key, outcome="timeout")
+                failures_total.inc(backend=model_key, reason="timeout")
+                raise TimeoutError(f"انتهت مهلة {AI_MODELS[model_key]['name']}")
+            except Exception:
+                breaker.record_failure(time.monotonic() - started)
+                backend_seconds.observe(time.monotonic() - started, backend=model_key, outcome="error")
+                failures_total.inc(backend=model_key, reason="error")
+                raise
+            breaker.record_success(time.monotonic() - started)
+            backend_seconds.observe(time.monotonic() - started, backend=model_key, outcome="ok")
+            return result
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._connect_executor.shutdown(wait=False, cancel_futures=True)
+
+# منفذ الاستدعاءات المشترك
+predict_executor = PredictExecutor(PREDICT_WORKERS, CONNECT_WORKERS)
+
+class ClientPool:
+    """مجمع عملاء Gradio دائمي الاتصال لنماذج AI_MODELS"""
+    
+    def __init__(self):
+        self._clients = {}
+        self._locks = {}
+    
+    def _lock(self, model_key: str) -> asyncio.Lock:
+        lock = self._locks.get(model_key)
+        if lock is None:
+            lock = self._locks[model_key] = asyncio.Lock()
+        return lock
+    
+    async def get(self, model_key: str):
+        """الحصول على عميل جاهز، مع الاتصال عند أول استخدام أو بعد الفشل"""
+        client = self._clients.get(model_key)
+        if client is not None:
+            return client
+        
+        # قفل لكل نموذج حتى لا تتكرر عملية الاتصال لطلبات متزامنة
+        async with self._lock(model_key):
+            client = self._clients.get(model_key)
+            if client is None:
+                model_info = AI_MODELS[model_key]
+                try:
+                    with stage_seconds.time(stage="client_connect"):
+                        client = await predict_executor.connect(create_gradio_client, model_info["client_id"])
+                except Exception:
+                    circuit_breakers[model_key].record_failure()
+                    failures_total.inc(backend=model_key, reason="connect")
+                    raise
+                self._clients[model_key] = client
+                logger.info(f"✅ تم الاتصال بنموذج {model_info['name']}")
+            return client
+    
+    def invalidate(self, model_key: str):
+        """إزالة عميل معطل ليُعاد الاتصال به عند الطلب التالي"""
+        if self._clients.pop(model_key, None) is not None:
+            logger.warning(f"⚠️ تمت إزالة عميل {AI_MODELS[model_key]['name']} وسيُعاد الاتصال لاحقاً")
+    
+    async def warm_up(self, model_keys=None):
+        """الاتصال المسبق بجميع النماذج عند بدء التشغيل"""
+        model_keys = list(model_keys or AI_MODELS)
+        results = await asyncio.gather(
+            *(self.get(model_key) for model_key in model_keys),
+            return_exceptions=True
+        )
+        for model_key, result in zip(model_keys, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ فشل الاتصال المسبق بنموذج {AI_MODELS[model_key]['name']}: {result}")
+
+# مجمع العملاء المشترك
+client_pool = ClientPool()
+
+# جلسة HTTP المشتركة لجميع التحميلات الصادرة
+http_session = SharedHttpSession()
+
+class SpaceKeepAlive:
+    """إبقاء Spaces مستيقظة: تتبع آخر استخدام لكل نموذج وإرسال طلبات خفيفة عند الخمول أو قبل الحاجة"""
+    
+    def __init__(self, idle_after: float, check_interval: float, wake_cooldown: float, timeout: float):
+        self.idle_after = idle_after
+        self.check_interval = check_interval
+        self.wake_cooldown = wake_cooldown
+        self.timeout = timeout
+        self._last_used = {}
+        self._last_probe = {}
+        self._inflight = {}
+        self._task = None
     
     @staticmethod
-    async def download_telegram_image(file_id: str, bot):
-        """تحميل وتحويل صورة من تليجرام إلى PIL Image"""
+    def space_url(model_key: str) -> str:
+        """رابط الـ Space المباشر، مثلاً krsatyam7/Virtual_Clothing_Try-On-new -> krsatyam7-virtual-clothing-try-on-new.hf.space"""
+        model_info = AI_MODELS[model_key]
+        if model_info.get("space_url"):
+            return model_info["space_url"].rstrip('/')
+        host = re.sub(r'[^a-z0-9]+', '-', model_info["client_id"].lower()).strip('-')
+        return f"https://{host}.hf.space"
+    
+    @staticmethod
+    def _enabled(model_key: str) -> bool:
+        return AI_MODELS[model_key].get("keep_alive", True)
+    
+    def touch(self, model_key: str):
+        """تسجيل استخدام فعلي للنموذج (الطلب نفسه يبقيه مستيقظاً)"""
+        self._last_used[model_key] = time.monotonic()
+    
+    def idle_for(self, model_key: str) -> float:
+        stamps = [t for t in (self._last_used.get(model_key), self._last_probe.get(model_key)) if t is not None]
+        return time.monotonic() - max(stamps) if stamps else float('inf')
+    
+    async def probe(self, model_key: str) -> bool:
+        """طلب /config خفيف يوقظ الـ Space دون تشغيل النموذج"""
+        self._last_probe[model_key] = time.monotonic()
+        url = self.space_url(model_key) + "/config"
+        try:
+            async with http_session.session.get(url, timeout=ClientTimeout(total=self.timeout)) as response:
+                await response.read()
+                ok = response.status < 400
+                if not ok:
+                    logger.warning(f"⚠️ استجابة {response.status} من {AI_MODELS[model_key]['name']} أثناء الإيقاظ")
+        except Exception as e:
+            ok = False
+            logger.warning(f"⚠️ تعذر الوصول إلى {AI_MODELS[model_key]['name']} أثناء الإيقاظ: {e}")
+        keepalive_probes.inc(backend=model_key, result="ok" if ok else "error")
+        return ok
+    
+    async def _wake(self, model_key: str):
+        await self.probe(model_key)
         try:
+            # تجهيز العميل أيضاً حتى يكون جاهزاً قبل وصول الصور
+            await client_pool.get(model_key)
+        except Exception as e:
+            logger.warning(f"⚠️ فشل الاتصال المسبق بنموذج {AI_MODELS[model_key]['name']}: {e}")
+    
+    def wake(self, *model_keys: str):
+        """إيقاظ النماذج في الخلفية عند دخول المستخدم إلى مسارها، دون انتظار"""
+        if not KEEPALIVE_ENABLED:
+            return
+        for model_key in model_keys:
+            if not self._enabled(model_key) or model_key in self._inflight:
+                continue
+            if self.idle_for(model_key) < self.wake_cooldown:
+                continue
+            task = asyncio.create_task(self._wake(model_key))
+            self._inflight[model_key] = task
+            task.add_done_callback(lambda _, key=model_key: self._inflight.pop(key, None))
+    
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            idle = [
+                model_key for model_key in AI_MODELS
+                if self._enabled(model_key)
+                and model_key not in self._inflight
+                and self.idle_for(model_key) >= self.idle_after
+            ]
+            if idle:
+                await asyncio.gather(*(self.probe(model_key) for model_key in idle), return_exceptions=True)
+    
+    def start(self):
+        if KEEPALIVE_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+    
+    async def stop(self):
+        tasks = list(self._inflight.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# جدولة إبقاء النماذج مستيقظة
+space_keep_alive = SpaceKeepAlive(KEEPALIVE_IDLE, KEEPALIVE_CHECK_INTERVAL, KEEPALIVE_WAKE_COOLDOWN, KEEPALIVE_TIMEOUT)
+
+class TelegramDownloader:
+    """تحميل صور تليجرام إلى الذاكرة مباشرة مع تخزين مؤقت حسب file_unique_id"""
+    
+    def __init__(self, max_bytes: int, cache_bytes: int):
+        self.max_bytes = max_bytes
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._inflight = {}
+    
+    def _remember(self, file_unique_id: str, data: bytes):
+        if len(data) > self.cache_bytes:
+            return
+        self._cache[file_unique_id] = data
+        self._cache_size += len(data)
+        # إزالة الأقدم استخداماً عند تجاوز السعة
+        while self._cache_size > self.cache_bytes:
+            _, old = self._cache.popitem(last=False)
+            self._cache_size -= len(old)
+    
+    async def _download(self, bot, file_id: str) -> bytes:
+        with stage_seconds.time(stage="telegram_get_file"):
             file = await bot.get_file(file_id)
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(file.file_path) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-                        return Image.open(BytesIO(image_data))
+        if file.file_size and file.file_size > self.max_bytes:
+            raise ValueError(f"حجم الصورة {file.file_size} يتجاوز الحد {self.max_bytes}")
+        
+        # التحميل عبر اتصال البوت نفسه إلى الذاكرة دون ملفات مؤقتة
+        buffer = BytesIO()
+        with stage_seconds.time(stage="telegram_download"):
+            await file.download_to_memory(buffer)
+        if buffer.tell() > self.max_bytes:
+            raise ValueError(f"حجم الصورة {buffer.tell()} يتجاوز الحد {self.max_bytes}")
+        return buffer.getvalue()
+    
+    async def fetch(self, bot, file_id: str, file_unique_id: str) -> bytes:
+        """إرجاع بايتات الصورة من الذاكرة أو تحميلها مرة واحدة فقط"""
+        data = self._cache.get(file_unique_id)
+        if data is not None:
+            self._cache.move_to_end(file_unique_id)
+            cache_requests.inc(cache="telegram_download", result="hit")
+            return data
+        cache_requests.inc(cache="telegram_download", result="miss")
+        
+        # مشاركة التحميل الجاري لنفس الصورة بدلاً من تكراره
+        task = self._inflight.get(file_unique_id)
+        if task is None:
+            task = asyncio.ensure_future(self._download(bot, file_id))
+            self._inflight[file_unique_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(file_unique_id, None))
+        data = await asyncio.shield(task)
+        if file_unique_id not in self._cache:
+            self._remember(file_unique_id, data)
+        return data
+    
+    def prefetch(self, bot, file_id: str, file_unique_id: str):
+        """بدء تحميل الصورة في الخلفية دون انتظار"""
+        if file_unique_id in self._cache or file_unique_id in self._inflight:
+            return
+        task = asyncio.ensure_future(self.fetch(bot, file_id, file_unique_id))
+        task.add_done_callback(self._log_prefetch_error)
+    
+    @staticmethod
+    def _log_prefetch_error(task: asyncio.Task):
+        # تسجيل الخطأ فقط، وستُعاد المحاولة عند الطلب الفعلي
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"⚠️ فشل التحميل المسبق للصورة: {task.exception()}")
+
+# محمل صور تليجرام المشترك
+telegram_downloader = TelegramDownloader(MAX_IMAGE_BYTES, DOWNLOAD_CACHE_BYTES)
+
+class ResultCache:
+    """ذاكرة نتائج معنونة بالمحتوى (ذاكرة + قرص) مع إزالة LRU وصلاحية زمنية"""
+    
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int, ttl: int):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = None
+        # عمليات القرص تعمل في خيوط منفصلة
+        self._disk_lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(*parts) -> str:
+        """بناء مفتاح من بصمات الصور واسم النموذج ونوع الملابس"""
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode('utf-8')
+            digest.update(hashlib.sha256(part).digest())
+        return digest.hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.img")
+    
+    def _load_disk_index(self):
+        # فهرسة الملفات الموجودة من تشغيل سابق مرتبة حسب آخر تعديل
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.img'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        self._disk = OrderedDict()
+        for mtime, key, size in sorted(entries):
+            self._disk[key] = (size, mtime)
+    
+    def _remember(self, key: str, data: bytes, stored_at: float):
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old[0])
+        self._memory[key] = (data, stored_at)
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+    
+    def _drop_disk(self, key: str):
+        self._disk.pop(key, None)
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+    
+    def _read_disk(self, key: str):
+        with self._disk_lock:
+            if self._disk is None:
+                self._load_disk_index()
+            entry = self._disk.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > self.ttl:
+                self._drop_disk(key)
+                return None
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                self._disk.pop(key, None)
+                return None
+            self._disk.move_to_end(key)
+            return data, entry[1]
+    
+    def _write_disk(self, key: str, data: bytes, stored_at: float):
+        with self._disk_lock:
+            if self._disk is None:
+                self._load_disk_index()
+            tmp_path = self._path(key) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            self._disk[key] = (len(data), stored_at)
+            self._disk.move_to_end(key)
+            total = sum(size for size, _ in self._disk.values())
+            while total > self.disk_bytes and len(self._disk) > 1:
+                old_key, (size, _) = next(iter(self._disk.items()))
+                self._drop_disk(old_key)
+                total -= size
+    
+    async def get(self, key: str):
+        """إرجاع بايتات النتيجة المخزنة أو None"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            if time.time() - entry[1] <= self.ttl:
+                self._memory.move_to_end(key)
+                return entry[0]
+            self._memory.pop(key)
+            self._memory_size -= len(entry[0])
+        try:
+            entry = await asyncio.to_thread(self._read_disk, key)
+        except Exception as e:
+            logger.warning(f"⚠️ تعذرت القراءة من ذاكرة النتائج: {e}")
             return None
+        if entry is None:
+            return None
+        self._remember(key, *entry)
+        return entry[0]
+    
+    async def put(self, key: str, data: bytes):
+        """تخزين بايتات النتيجة في الذاكرة وعلى القرص"""
+        stored_at = time.time()
+        self._remember(key, data, stored_at)
+        try:
+            await asyncio.to_thread(self._write_disk, key, data, stored_at)
         except Exception as e:
-            logger.error(f"❌ خطأ في تحميل الصورة: {e}")
+            logger.warning(f"⚠️ تعذرت الكتابة في ذاكرة النتائج: {e}")
+
+# ذاكرة نتائج تجربة الملابس المشتركة
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MEMORY_BYTES, RESULT_CACHE_DISK_BYTES, RESULT_CACHE_TTL)
+
+class FileIdCache:
+    """ربط بصمة الصورة بمعرف file_id الذي أعاده تليجرام عند أول رفع"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._file_ids = OrderedDict()
+    
+    @staticmethod
+    async def digest(photo):
+        """حساب بصمة الصورة (بايتات، BytesIO أو مسار ملف محلي)"""
+        if isinstance(photo, (bytes, bytearray)):
+            return hashlib.sha256(photo).hexdigest()
+        if isinstance(photo, BytesIO):
+            return hashlib.sha256(photo.getbuffer()).hexdigest()
+        if isinstance(photo, str) and os.path.isfile(photo):
+            def _hash_file():
+                digest = hashlib.sha256()
+                with open(photo, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(chunk)
+                return digest.hexdigest()
+            return await asyncio.to_thread(_hash_file)
+        return None
+    
+    def get(self, digest: str):
+        file_id = self._file_ids.get(digest)
+        if file_id is not None:
+            self._file_ids.move_to_end(digest)
+        return file_id
+    
+    def put(self, digest: str, file_id: str):
+        self._file_ids[digest] = file_id
+        self._file_ids.move_to_end(digest)
+        while len(self._file_ids) > self.max_entries:
+            self._file_ids.popitem(last=False)
+    
+    def discard(self, digest: str):
+        self._file_ids.pop(digest, None)
+
+# معرفات الصور المرسلة سابقاً
+file_id_cache = FileIdCache(FILE_ID_CACHE_SIZE)
+
+class TranslationCache:
+    """ذاكرة ترجمات الأوصاف (LRU مع صلاحية زمنية) مع حفظ اختياري في SQLite"""
+    
+    # التشكيل والتطويل وعلامات الترقيم التي لا تغير معنى الوصف
+    _DIACRITICS = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+    _PUNCTUATION = re.compile(r'[\s"\'«»“”.,!?؟،؛:…]+')
+    _ALEF = re.compile(r'[أإآٱ]')
+    
+    def __init__(self, max_entries: int, ttl: int, db_path: str = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+    
+    @classmethod
+    def normalize(cls, text: str) -> str:
+        """توحيد الوصف حتى تتطابق الأوصاف شبه المتماثلة"""
+        text = cls._DIACRITICS.sub('', text)
+        text = cls._ALEF.sub('ا', text).replace('ى', 'ي')
+        text = cls._PUNCTUATION.sub(' ', text)
+        return text.strip().casefold()
+    
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM translations WHERE created < ?", (time.time() - self.ttl,))
+            self._db.commit()
+        return self._db
+    
+    def _db_get(self, key: str):
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT value, created FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+        return row
+    
+    def _db_put(self, key: str, value: str, created: float):
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO translations (key, value, created) VALUES (?, ?, ?)",
+                (key, value, created)
+            )
+            db.commit()
+    
+    def _remember(self, key: str, value: str, created: float):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def get(self, text: str):
+        """إرجاع الترجمة المحفوظة أو None"""
+        key = self.normalize(text)
+        entry = self._entries.get(key)
+        if entry is None and self.db_path:
+            try:
+                entry = await asyncio.to_thread(self._db_get, key)
+            except Exception as e:
+                logger.warning(f"⚠️ تعذرت القراءة من ذاكرة الترجمات: {e}")
+            if entry is not None:
+                self._remember(key, *entry)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.ttl:
+            self._entries.pop(key, None)
             return None
+        self._entries.move_to_end(key)
+        return entry[0]
+    
+    async def put(self, text: str, translation: str):
+        """حفظ ترجمة في الذاكرة وفي قاعدة البيانات إن وجدت"""
+        key = self.normalize(text)
+        created = time.time()
+        self._remember(key, translation, created)
+        if self.db_path:
+            try:
+                await asyncio.to_thread(self._db_put, key, translation, created)
+            except Exception as e:
+                logger.warning(f"⚠️ تعذرت الكتابة في ذاكرة الترجمات: {e}")
+    
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+# ذاكرة ترجمات الأوصاف المشتركة
+translation_cache = TranslationCache(TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL, TRANSLATION_CACHE_DB or None)
+
+class JobRejected(Exception):
+    """رفض مهمة بسبب امتلاء الطابور أو وجود مهمة نشطة للمستخدم"""
+
+class JobScheduler:
+    """طابور مهام الذكاء الاصطناعي الثقيلة مع عمال لكل نموذج ومهمة نشطة واحدة لكل مستخدم"""
+    
+    class _Job:
+        __slots__ = ("user_id", "factory", "future", "on_position", "position", "notified_at", "latest", "deferred")
+        
+        def __init__(self, user_id, factory, future, on_position):
+            self.user_id = user_id
+            self.factory = factory
+            self.future = future
+            self.on_position = on_position
+            self.position = None
+            self.notified_at = 0.0
+            self.latest = None
+            self.deferred = None
+    
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._queues = {}
+        self._pending = {}
+        self._busy = {}
+        self._workers = []
+        self._active_users = set()
+        self._notifications = set()
+    
+    async def start(self):
+        """تشغيل العمال لكل نموذج حسب إعداد workers في AI_MODELS"""
+        for model_key, model_info in AI_MODELS.items():
+            self._queues[model_key] = asyncio.Queue(maxsize=self.queue_size)
+            self._pending[model_key] = []
+            self._busy[model_key] = 0
+            for _ in range(model_info.get("workers", 1)):
+                self._workers.append(asyncio.create_task(self._worker(model_key)))
+    
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+    
+    def queue_depth(self, model_key: str) -> int:
+        return len(self._pending.get(model_key, ()))
+    
+    def _track(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+        return task
+    
+    def _send_position(self, job, position: int):
+        job.position = position
+        job.notified_at = time.monotonic()
+        self._track(job.on_position(position))
+    
+    async def _deferred_position(self, job, delay: float):
+        await asyncio.sleep(delay)
+        job.deferred = None
+        if job.latest != job.position:
+            self._send_position(job, job.latest)
+    
+    def _notify(self, job, position: int):
+        if job.on_position is None:
+            return
+        job.latest = position
+        if position == job.position or job.deferred is not None:
+            # لا تغيير، أو أن تحديثاً مؤجلاً سيرسل أحدث ترتيب
+            return
+        # كل سحب من الطابور يغير ترتيب جميع المنتظرين، وتعديل رسائلهم كلها في كل مرة
+        # يستهلك حد تليجرام للتعديلات؛ لذا يُحدَّث ترتيب كل مستخدم مرة كل فاصل على الأكثر،
+        # وما يقع داخل الفاصل يُؤجَّل إلى نهايته حتى لا يبقى الترتيب المعروض قديماً
+        delay = job.notified_at + QUEUE_POSITION_INTERVAL - time.monotonic()
+        if job.position is not None and delay > 0:
+            job.deferred = self._track(self._deferred_position(job, delay))
+            return
+        self._send_position(job, position)
     
     @staticmethod
-    async def process_virtual_tryon(person_img, garment_img, model_key, garment_type="upper_body"):
-        """معالجة طلب تجربة الملابس الافتراضية"""
+    def _cancel_deferred(job):
+        if job.deferred is not None:
+            job.deferred.cancel()
+            job.deferred = None
+    
+    async def _worker(self, model_key: str):
+        queue = self._queues[model_key]
+        pending = self._pending[model_key]
+        while True:
+            job = await queue.get()
+            pending.remove(job)
+            # بدأت المهمة، فلا معنى لتحديث ترتيبها لاحقاً
+            self._cancel_deferred(job)
+            # إبلاغ المنتظرين بترتيبهم الجديد
+            for position, waiting in enumerate(pending, start=1):
+                self._notify(waiting, position)
+            if job.future.done():
+                queue.task_done()
+                continue
+            self._busy[model_key] += 1
+            try:
+                result = await job.factory()
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._busy[model_key] -= 1
+                queue.task_done()
+    
+    async def run(self, user_id: int, model_key: str, factory, on_position=None):
+        """إضافة مهمة إلى طابور النموذج وانتظار نتيجتها"""
+        if user_id in self._active_users:
+            raise JobRejected("⏳ لديك طلب قيد المعالجة بالفعل، انتظر حتى ينتهي")
+        queue = self._queues.get(model_key)
+        if queue is None:
+            # الطابور لم يبدأ بعد (مثلاً قبل post_init)، التنفيذ مباشرة
+            return await factory()
+        if queue.full():
+            raise JobRejected("🚦 الخدمة مزدحمة حالياً، حاول بعد قليل")
+        
+        job = self._Job(user_id, factory, asyncio.get_running_loop().create_future(), on_position)
+        self._active_users.add(user_id)
         try:
-            # إنشاء عميل AI
-            client = await GraffitiAI.create_ai_client(model_key)
-            if not client:
-                return None, "❌ فشل في الاتصال بخدمة الذكاء الاصطناعي"
-            
-            # حفظ الصور مؤقتاً
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as person_file:
-                person_img.save(person_file.name, format='PNG')
-                person_path = person_file.name
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as garment_file:
-                garment_img.save(garment_file.name, format='PNG')
-                garment_path = garment_file.name
-              # تشغيل النموذج المناسب مع إعادة المحاولة
-            model_info = AI_MODELS[model_key]
-            result = None
-            
+            self._pending[model_key].append(job)
+            queue.put_nowait(job)
+            # إظهار الترتيب فقط إذا لم يتوفر عامل فارغ
+            idle = AI_MODELS[model_key].get("workers", 1) - self._busy[model_key]
+            position = len(self._pending[model_key]) - max(idle, 0)
+            if position > 0:
+                self._notify(job, position)
+            return await job.future
+        finally:
+            # إلغاء انتظار المستخدم يلغي المهمة إن لم تبدأ بعد
+            if not job.future.done():
+                job.future.cancel()
+            self._cancel_deferred(job)
+            self._active_users.discard(user_id)
+
+# طابور المهام المشترك
+job_scheduler = JobScheduler(JOB_QUEUE_SIZE)
+
+def _image_file(data):
+    """ملف يقرأ منه PIL: البايتات تُغلف في BytesIO (دون نسخ)، والملفات تُمرر كما هي"""
+    return data if hasattr(data, "read") else BytesIO(data)
+
+def preprocess_photo(data, max_side: int, jpeg_quality: int) -> bytes:
+    """تصحيح اتجاه EXIF وتصغير الصورة مع الحفاظ على النسبة؛ تُعاد كما هي إن لم تحتج لذلك"""
+    # PIL يُستورد داخل عامل مجمع العمليات فقط
+    from PIL import Image, ImageOps
+    image = Image.open(_image_file(data))
+    orientation = image.getexif().get(0x0112, 1)
+    if max(image.size) <= max_side and orientation == 1:
+        return data
+    
+    # فك ترميز JPEG بدقة مخفضة مباشرة (أسرع بكثير من فك الصورة كاملة ثم تصغيرها)
+    if image.format == 'JPEG':
+        image.draft('RGB', (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=jpeg_quality)
+    return buffer.getvalue()
+
+def encode_jpeg(data, jpeg_quality: int) -> bytes:
+    """إعادة ترميز صورة بصيغة JPEG سريعة بدلاً من PNG بدون فقد"""
+    from PIL import Image
+    image = Image.open(_image_file(data))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=jpeg_quality)
+    return buffer.getvalue()
+
+class _SharedBufferReader(io.RawIOBase):
+    """ملف للقراءة فوق الذاكرة المشتركة مباشرة: PIL يقرأ منه على دفعات دون نسخ الصورة كاملة"""
+    
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def tell(self) -> int:
+        return self._pos
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(base + offset, 0)
+        return self._pos
+    
+    def readinto(self, buffer) -> int:
+        count = max(min(len(buffer), len(self._view) - self._pos), 0)
+        buffer[:count] = self._view[self._pos:self._pos + count]
+        self._pos += count
+        return count
+    
+    def close(self):
+        # تحرير العرض قبل إغلاق الذاكرة المشتركة (وإلا رفض close وجود مؤشرات مُصدَّرة)
+        self._view.release()
+        super().close()
+
+def _run_on_shared_memory(func, in_name: str, size: int, out_name: str, capacity: int, args):
+    """تُنفذ داخل عملية العامل: قراءة المدخل من الذاكرة المشتركة وكتابة الناتج في ذاكرة
+    أنشأتها العملية الرئيسية؛ تُعيد None إن لم تتغير الصورة، وطول الناتج، أو البايتات إن تجاوزت السعة"""
+    shm_in = SharedMemory(name=in_name)
+    try:
+        with _SharedBufferReader(shm_in.buf[:size]) as source:
+            result = func(source, *args)
+            if result is source:
+                # لم تتغير الصورة، لا داعي لنسخها مرة أخرى
+                return None
+    finally:
+        shm_in.close()
+    if len(result) > capacity:
+        # نادر: الناتج أكبر من المساحة المحجوزة، فيُعاد عبر pickle
+        return result
+    shm_out = SharedMemory(name=out_name)
+    try:
+        shm_out.buf[:len(result)] = result
+    finally:
+        shm_out.close()
+    return len(result)
+
+class ImageProcessPool:
+    """تشغيل عمليات PIL الثقيلة في عمليات منفصلة مع تمرير البايتات عبر الذاكرة المشتركة"""
+    
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = None
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # forkserver بدل fork: حلقة الأحداث وخيوط المجمعات الأخرى لا تُنسخ إلى العمال
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        return self._executor
+    
+    async def _submit(self, func, shm_in: SharedMemory, size: int, shm_out: SharedMemory, args):
+        future = self._get_executor().submit(
+            _run_on_shared_memory, func, shm_in.name, size, shm_out.name, shm_out.size, args
+        )
+        return await asyncio.wrap_future(future)
+    
+    async def run(self, func, data: bytes, *args) -> bytes:
+        """تنفيذ func(data, *args) في مجمع العمليات وإرجاع البايتات الناتجة"""
+        # العملية الرئيسية تنشئ ذاكرة المدخل والناتج وتحذفهما دائماً (حتى عند الإلغاء)، فلا يملك
+        # متتبع موارد العامل أي مقطع؛ مساحة الناتج لا تُحجز فعلياً إلا عند الكتابة فيها
+        shm_in = SharedMemory(create=True, size=max(len(data), 1))
+        shm_out = SharedMemory(create=True, size=max(2 * len(data), IMAGE_OUTPUT_MIN_BYTES))
+        try:
+            shm_in.buf[:len(data)] = data
             try:
-                if model_key == "g1_fast":
-                    # النموذج الأول: krsatyam7/Virtual_Clothing_Try-On-new
-                    result = client.predict(
-                        person_image=handle_file(person_path),
-                        clothing_image=handle_file(garment_path),
-                        api_name=model_info["api_endpoint"]
-                    )
-                else:  # g1_pro
-                    # النموذج الثاني: PawanratRung/virtual-try-on
-                    result = client.predict(
-                        handle_file(person_path),
-                        handle_file(garment_path),
-                        garment_type,
-                        api_name=model_info["api_endpoint"]
-                    )
-            except Exception as api_error:
-                logger.error(f"❌ خطأ في API: {api_error}")
-                # محاولة مع النموذج البديل
+                outcome = await self._submit(func, shm_in, len(data), shm_out, args)
+            except BrokenProcessPool:
+                # توقف عامل بشكل مفاجئ (نفاد الذاكرة مثلاً) فيتعطل المجمع كله؛ نبني مجمعاً جديداً ونعيد المحاولة مرة
+                logger.warning("⚠️ تعطل مجمع عمليات الصور، إعادة إنشائه")
+                self.shutdown()
                 try:
-                    if model_key == "g1_fast":
-                        # جرب النموذج البديل G1 Pro
-                        alt_client = Client("PawanratRung/virtual-try-on")
-                        result = alt_client.predict(
-                            handle_file(person_path),
-                            handle_file(garment_path),
-                            "upper_body",
-                            api_name="/virtual_tryon"
-                        )
-                    else:
-                        # جرب النموذج البديل G1 Fast
-                        alt_client = Client("krsatyam7/Virtual_Clothing_Try-On-new")
-                        result = alt_client.predict(
-                            person_image=handle_file(person_path),
-                            clothing_image=handle_file(garment_path),
-                            api_name="/swap_clothing"
-                        )
-                except Exception as fallback_error:
-                    logger.error(f"❌ فشل في النموذج البديل: {fallback_error}")
-                    return None, "❌ جميع النماذج غير متاحة حالياً، حاول لاحقاً"
-            
-            # تنظيف الملفات المؤقتة
+                    outcome = await self._submit(func, shm_in, len(data), shm_out, args)
+                except BrokenProcessPool:
+                    # الصورة نفسها تُسقط العامل، فلا نترك المجمع المعطل للطلبات التالية
+                    self.shutdown()
+                    raise
+            if outcome is None:
+                return data
+            if isinstance(outcome, bytes):
+                return outcome
+            # النسخة الوحيدة في العملية الرئيسية: البايتات التي تُعاد للمستدعي
+            return bytes(shm_out.buf[:outcome])
+        finally:
+            for shm in (shm_in, shm_out):
+                shm.close()
+                shm.unlink()
+    
+    def worker_pids(self) -> list:
+        """معرفات عمليات العمال الحالية (لقياس ذاكرتها من الخارج)"""
+        if self._executor is None:
+            return []
+        return list(self._executor._processes or ())
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# مجمع عمليات معالجة الصور المشترك
+image_process_pool = ImageProcessPool(IMAGE_WORKERS)
+
+class ImageStaging:
+    """تسليم الصور إلى Gradio كملفات مؤقتة دون إعادة ترميز كلما أمكن"""
+    
+    _SUFFIXES = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+    
+    def __init__(self, directory: str, jpeg_quality: int):
+        self.directory = directory
+        self.jpeg_quality = jpeg_quality
+    
+    @staticmethod
+    def detect_format(data: bytes):
+        """تحديد صيغة الصورة من أول بايتات دون فك ترميزها"""
+        if data[:3] == b'\xff\xd8\xff':
+            return "JPEG"
+        if data[:8] == b'\x89PNG\r\n\x1a\n':
+            return "PNG"
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            return "WEBP"
+        return None
+    
+    def _write(self, data: bytes, image_format: str) -> str:
+        fd, path = tempfile.mkstemp(suffix=self._SUFFIXES[image_format], dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        except Exception:
+            os.unlink(path)
+            raise
+        return path
+    
+    @contextlib.asynccontextmanager
+    async def stage(self, model_key: str, *images: bytes):
+        """كتابة الصور كملفات مؤقتة وإرجاع مساراتها، مع حذفها دائماً عند الخروج"""
+        accepted = AI_MODELS[model_key].get("input_formats", ())
+        paths = []
+        try:
+            for data in images:
+                with stage_seconds.time(stage="staging"):
+                    image_format = self.detect_format(data)
+                    if image_format not in accepted:
+                        data = await image_process_pool.run(encode_jpeg, data, self.jpeg_quality)
+                        image_format = "JPEG"
+                    paths.append(await asyncio.to_thread(self._write, data, image_format))
+            yield paths
+        finally:
+            for path in paths:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+# مسلم الصور المشترك
+image_staging = ImageStaging(STAGING_DIR, STAGING_JPEG_QUALITY)
+
+class UserSession:
+    """حالة مستخدم واحد؛ تحفظ معرفات الصور فقط وليس الصور نفسها"""
+    
+    __slots__ = (
+        "mode", "step", "model", "garment_type",
+        "person_file_id", "person_unique_id",
+        "garment_file_id", "garment_unique_id",
+        "last_seen"
+    )
+    
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+        if self.last_seen is None:
+            self.last_seen = time.time()
+    
+    def size(self) -> int:
+        """الحجم التقريبي للجلسة في الذاكرة"""
+        return sys.getsizeof(self) + sum(
+            sys.getsizeof(getattr(self, name)) for name in self.__slots__
+            if getattr(self, name) is not None
+        )
+    
+    def to_json(self) -> str:
+        return json.dumps({name: getattr(self, name) for name in self.__slots__})
+    
+    @classmethod
+    def from_json(cls, data) -> "UserSession":
+        return cls(**json.loads(data))
+
+class SessionBackend(ABC):
+    """واجهة مخزن الجلسات؛ الصور نفسها لا تُخزن هنا بل معرفاتها في تليجرام فقط
+    (لا يشارك المخزن إلا بيانات الجلسة، انظر SESSION_BACKEND)"""
+    
+    def __init__(self, idle_ttl: int):
+        self.idle_ttl = idle_ttl
+        self._sweeper = None
+    
+    @abstractmethod
+    async def get(self, user_id: int):
+        """إرجاع جلسة المستخدم النشطة أو None"""
+    
+    @abstractmethod
+    async def save(self, user_id: int, session: UserSession):
+        """حفظ الجلسة بعد تعديلها"""
+    
+    @abstractmethod
+    async def reset(self, user_id: int):
+        """حذف جلسة المستخدم"""
+    
+    @abstractmethod
+    async def count(self) -> int:
+        """عدد الجلسات النشطة"""
+    
+    async def expire(self):
+        """حذف الجلسات الخاملة (إن لم يقم المخزن بذلك تلقائياً)"""
+    
+    async def create(self, user_id: int, **fields) -> UserSession:
+        """بدء جلسة جديدة تحل محل السابقة"""
+        session = UserSession(**fields)
+        await self.save(user_id, session)
+        return session
+    
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(min(self.idle_ttl, 60))
             try:
-                os.unlink(person_path)
-                os.unlink(garment_path)
-            except:
-                pass
-            
-            if result:
-                return result, "✅ تم إنتاج النتيجة بنجاح!"
-            else:
-                return None, "❌ لم يتم إنتاج نتيجة"                
-        except Exception as e:
-            logger.error(f"❌ خطأ في معالجة تجربة الملابس: {e}")
-            return None, f"❌ خطأ: {str(e)}"
+                await self.expire()
+            except Exception as e:
+                logger.warning(f"⚠️ فشل تنظيف الجلسات الخاملة: {e}")
+    
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+    
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+class MemorySessionBackend(SessionBackend):
+    """مخزن جلسات في ذاكرة العملية، محدود بالحجم مع حذف الجلسات الخاملة"""
+    
+    def __init__(self, idle_ttl: int, memory_budget: int):
+        super().__init__(idle_ttl)
+        self.memory_budget = memory_budget
+        # مرتبة حسب آخر نشاط، الأقدم أولاً
+        self._sessions = OrderedDict()
+        self._sizes = {}
+        self._total_size = 0
+    
+    def _drop(self, user_id: int):
+        self._sessions.pop(user_id, None)
+        self._total_size -= self._sizes.pop(user_id, 0)
+    
+    async def expire(self):
+        deadline = time.time() - self.idle_ttl
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.last_seen > deadline:
+                break
+            self._drop(user_id)
+    
+    async def count(self) -> int:
+        return len(self._sessions)
+    
+    async def get(self, user_id: int):
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        if time.time() - session.last_seen > self.idle_ttl:
+            self._drop(user_id)
+            return None
+        session.last_seen = time.time()
+        self._sessions.move_to_end(user_id)
+        return session
+    
+    async def save(self, user_id: int, session: UserSession):
+        session.last_seen = time.time()
+        self._total_size -= self._sizes.get(user_id, 0)
+        self._sessions[user_id] = session
+        self._sessions.move_to_end(user_id)
+        self._sizes[user_id] = session.size()
+        self._total_size += self._sizes[user_id]
+        # إزالة الجلسات الأقدم نشاطاً عند تجاوز الميزانية
+        while self._total_size > self.memory_budget and len(self._sessions) > 1:
+            self._drop(next(iter(self._sessions)))
+    
+    async def reset(self, user_id: int):
+        self._drop(user_id)
+
+class SQLiteSessionBackend(SessionBackend):
+    """مخزن جلسات في SQLite يمكن مشاركته بين عدة عمليات على نفس الجهاز"""
+    
+    def __init__(self, path: str, idle_ttl: int):
+        super().__init__(idle_ttl)
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+    
+    def _execute(self, query: str, params=(), fetch=False):
+        with self._lock:
+            if self._db is None:
+                self._db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                # وضع WAL يسمح بالقراءة المتزامنة من عدة عمليات
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions "
+                    "(user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, last_seen REAL NOT NULL)"
+                )
+            cursor = self._db.execute(query, params)
+            rows = cursor.fetchall() if fetch else None
+            self._db.commit()
+            return rows
+    
+    async def get(self, user_id: int):
+        now = time.time()
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT data FROM sessions WHERE user_id = ? AND last_seen > ?",
+            (user_id, now - self.idle_ttl),
+            True
+        )
+        if not rows:
+            return None
+        session = UserSession.from_json(rows[0][0])
+        session.last_seen = now
+        await asyncio.to_thread(
+            self._execute, "UPDATE sessions SET last_seen = ? WHERE user_id = ?", (now, user_id)
+        )
+        return session
+    
+    async def save(self, user_id: int, session: UserSession):
+        session.last_seen = time.time()
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO sessions (user_id, data, last_seen) VALUES (?, ?, ?)",
+            (user_id, session.to_json(), session.last_seen)
+        )
+    
+    async def reset(self, user_id: int):
+        await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE user_id = ?", (user_id,))
+    
+    async def count(self) -> int:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT COUNT(*) FROM sessions WHERE last_seen > ?",
+            (time.time() - self.idle_ttl,),
+            True
+        )
+        return rows[0][0]
+    
+    async def expire(self):
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM sessions WHERE last_seen <= ?", (time.time() - self.idle_ttl,)
+        )
+    
+    async def stop(self):
+        await super().stop()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+class RedisSessionBackend(SessionBackend):
+    """مخزن جلسات عبر بروتوكول Redis لمشاركة الحالة بين عدة أجهزة"""
+    
+    KEY_PREFIX = "graffiti:session:"
+    
+    def __init__(self, url: str, idle_ttl: int):
+        super().__init__(idle_ttl)
+        # استيراد عند الحاجة فقط، فالمكتبة ليست ضمن المتطلبات الأساسية
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise ValueError("❌ SESSION_BACKEND=redis يتطلب تثبيت مكتبة redis")
+        self._redis = redis_asyncio.from_url(url)
+    
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}{user_id}"
+    
+    async def get(self, user_id: int):
+        # GETEX يجدد مدة الصلاحية مع كل قراءة
+        data = await self._redis.getex(self._key(user_id), ex=self.idle_ttl)
+        if data is None:
+            return None
+        session = UserSession.from_json(data)
+        session.last_seen = time.time()
+        return session
+    
+    async def save(self, user_id: int, session: UserSession):
+        session.last_seen = time.time()
+        await self._redis.set(self._key(user_id), session.to_json(), ex=self.idle_ttl)
+    
+    async def reset(self, user_id: int):
+        await self._redis.delete(self._key(user_id))
+    
+    async def count(self) -> int:
+        count = 0
+        async for _ in self._redis.scan_iter(match=f"{self.KEY_PREFIX}*"):
+            count += 1
+        return count
+    
+    def start(self):
+        # Redis يحذف الجلسات المنتهية تلقائياً عبر EX
+        pass
+    
+    async def stop(self):
+        # aclose متاحة في الإصدارات الحديثة من redis-py
+        close = getattr(self._redis, "aclose", None) or self._redis.close
+        await close()
+
+def create_session_store() -> SessionBackend:
+    """إنشاء مخزن الجلسات حسب SESSION_BACKEND"""
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionBackend(SESSION_DB_PATH, SESSION_IDLE_TTL)
+    if SESSION_BACKEND == "redis":
+        return RedisSessionBackend(REDIS_URL, SESSION_IDLE_TTL)
+    if SESSION_BACKEND != "memory":
+        logger.warning(f"⚠️ SESSION_BACKEND غير معروف '{SESSION_BACKEND}'، سيتم استخدام الذاكرة")
+    return MemorySessionBackend(SESSION_IDLE_TTL, SESSION_MEMORY_BUDGET)
+
+# حالات المستخدمين
+session_store = create_session_store()
+
+class GraffitiAI:
+    """فئة رئيسية لبوت Graffiti AI"""
     
     @staticmethod
-    async def generate_image(prompt: str, width: int = 1024, height: int = 1024):
-        """توليد صورة باستخدام الذكاء الاصطناعي"""
+    def backend_candidates(model_key: str, garment_type: str = None):
+        """النموذج المطلوب أولاً ثم بدائله من السجل التي تدعم نوع الملابس، مرتبة حسب درجة الصحة"""
+        fallbacks = [
+            key for key in AI_MODELS[model_key].get("fallbacks", ())
+            if garment_type is None or garment_type in AI_MODELS[key].get("garment_types", ())
+        ]
+        fallbacks.sort(key=lambda key: circuit_breakers[key].health_score(), reverse=True)
+        return [model_key, *fallbacks]
+    
+    @staticmethod
+    def hedge_delay(model_key: str) -> float:
+        """مهلة انتظار النموذج الأساسي قبل إرسال الطلب الاحتياطي"""
+        latency = circuit_breakers[model_key].latency_percentile(HEDGE_PERCENTILE)
+        return latency if latency is not None else HEDGE_DEFAULT_DELAY
+    
+    @staticmethod
+    async def call_backend(backend_key: str, *inputs):
+        """إرسال طلب إلى نموذج من السجل بعد تحويل المدخلات بمحول المعاملات الخاص به"""
+        model_info = AI_MODELS[backend_key]
+        if not circuit_breakers[backend_key].allow():
+            failures_total.inc(backend=backend_key, reason="circuit_open")
+            raise BackendUnavailable(f"{model_info['name']} معطل مؤقتاً")
+        try:
+            client = await client_pool.get(backend_key)
+        except BaseException:
+            circuit_breakers[backend_key].release()
+            raise
+        args, kwargs = model_info["adapter"](*inputs)
+        space_keep_alive.touch(backend_key)
         try:
-            # إنشاء عميل توليد الصور
-            client = Client("black-forest-labs/FLUX.1-dev")
-            logger.info("✅ تم الاتصال بمولد الصور Graffiti G1-Image Generator")
-              # توليد الصورة
-            result = client.predict(
-                prompt=prompt,
-                seed=0,
-                randomize_seed=True,
-                width=width,
-                height=height,
-                guidance_scale=3.5,
-                num_inference_steps=28,
-                api_name="/infer"
+            return await predict_executor.predict(
+                backend_key, client, *args, api_name=model_info["api_endpoint"], **kwargs
             )
-            
-            if result:
-                logger.info("✅ تم توليد الصورة بنجاح")
-                
-                # التعامل مع أنواع مختلفة من النتائج
-                if isinstance(result, str):
-                    # إذا كان النتيجة URL
-                    if result.startswith('http'):
-                        try:
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(result) as response:
-                                    if response.status == 200:
-                                        image_data = await response.read()
-                                        return BytesIO(image_data), "✅ تم توليد الصورة بنجاح!"
-                                    else:
-                                        return None, "❌ فشل في تحميل الصورة المولدة"
-                        except Exception as download_error:
-                            logger.error(f"❌ خطأ في تحميل الصورة من URL: {download_error}")
-                            return None, "❌ فشل في تحميل الصورة المولدة"
-                    
-                    # إذا كان النتيجة مسار ملف محلي
-                    elif os.path.exists(result):
-                        try:
-                            with open(result, 'rb') as f:
-                                image_data = f.read()
-                            return BytesIO(image_data), "✅ تم توليد الصورة بنجاح!"
-                        except Exception as file_error:
-                            logger.error(f"❌ خطأ في قراءة الملف: {file_error}")
-                            return None, "❌ فشل في قراءة الصورة المولدة"
-                
-                # إذا كان النتيجة قائمة (multiple outputs)
-                elif isinstance(result, (list, tuple)) and len(result) > 0:
-                    # أخذ أول نتيجة
-                    first_result = result[0]
-                    if isinstance(first_result, str):
-                        if first_result.startswith('http'):
-                            try:
-                                async with aiohttp.ClientSession() as session:
-                                    async with session.get(first_result) as response:
-                                        if response.status == 200:
-                                            image_data = await response.read()
-                                            return BytesIO(image_data), "✅ تم توليد الصورة بنجاح!"
-                            except Exception as download_error:
-                                logger.error(f"❌ خطأ في تحميل الصورة من URL: {download_error}")
-                        elif os.path.exists(first_result):
-                            try:
-                                with open(first_result, 'rb') as f:
-                                    image_data = f.read()
-                                return BytesIO(image_data), "✅ تم توليد الصورة بنجاح!"
-                            except Exception as file_error:
-                                logger.error(f"❌ خطأ في قراءة الملف: {file_error}")
-                    else:
-                        # قد يكون ملف مباشر
-                        return first_result, "✅ تم توليد الصورة بنجاح!"
-                
-                # محاولة أخيرة - إذا كان النتيجة ملف مباشر
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            client_pool.invalidate(backend_key)
+            raise
+    
+    @staticmethod
+    async def hedged_call(model_key: str, hedge_key: str, *inputs):
+        """إرسال الطلب للنموذج الأساسي ثم للبديل إذا تأخر، وأول نتيجة ناجحة تفوز ويُلغى الآخر؛
+        تُعاد النتيجة مع مفتاح النموذج الذي أنتجها"""
+        primary = asyncio.create_task(GraffitiAI.call_backend(model_key, *inputs))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=GraffitiAI.hedge_delay(model_key))
+            if done:
+                if primary.exception() is None:
+                    return primary.result(), model_key
+                # فشل الأساسي (أو كان معطلاً) قبل مهلة التحوط: التحويل إلى البديل مباشرة
+                if isinstance(primary.exception(), BackendUnavailable):
+                    logger.warning(f"⚡ تخطي النموذج: {primary.exception()}")
                 else:
-                    return result, "✅ تم توليد الصورة بنجاح!"
-                    
-                return None, "❌ تعذر معالجة الصورة المولدة"
-            else:
-                return None, "❌ لم يتم توليد الصورة"
-                
-        except Exception as e:
-            logger.error(f"❌ خطأ في توليد الصورة: {e}")
-            return None, f"❌ خطأ في توليد الصورة: {str(e)}"
+                    logger.error(f"❌ خطأ في API {AI_MODELS[model_key]['name']}: {primary.exception()}")
+                result = await GraffitiAI.call_backend(hedge_key, *inputs)
+                fallbacks_total.inc(model=model_key, backend=hedge_key)
+                return result, hedge_key
+            
+            logger.info(f"🏁 تأخر {AI_MODELS[model_key]['name']}، إرسال طلب احتياطي إلى {AI_MODELS[hedge_key]['name']}")
+            hedges_total.inc(model=model_key, backend=hedge_key)
+            pending.add(asyncio.create_task(GraffitiAI.call_backend(hedge_key, *inputs)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is primary:
+                            return task.result(), model_key
+                        fallbacks_total.inc(model=model_key, backend=hedge_key)
+                        return task.result(), hedge_key
+                    error = task.exception()
+                    logger.warning(f"⚠️ فشل أحد الطلبين المتوازيين: {error}")
+            raise error
+        finally:
+            # إلغاء الطلب الخاسر (أو كلاهما عند إلغاء المعالجة)
+            for task in pending:
+                task.cancel()
+    
+    @staticmethod
+    async def dispatch(model_key: str, *inputs, garment_type: str = None):
+        """تشغيل الطلب على النموذج المطلوب ثم بدائله حسب السجل، مع تخطي النماذج المعطلة؛
+        تُعاد النتيجة مع مفتاح النموذج الذي أنتجها فعلاً"""
+        candidates = GraffitiAI.backend_candidates(model_key, garment_type)
+        
+        # عند وجود بديل يدعم نفس الطلب يمكن إرسال نسخة احتياطية إليه عند التأخر
+        if TRYON_HEDGING and len(candidates) > 1:
+            primary_key, hedge_key, *candidates = candidates
+            try:
+                return await GraffitiAI.hedged_call(primary_key, hedge_key, *inputs)
+            except BackendUnavailable as unavailable:
+                logger.warning(f"⚡ تخطي النموذج: {unavailable}")
+            except Exception as api_error:
+                logger.error(f"❌ فشل الطلب المتوازي: {api_error}")
+        
+        for backend_key in candidates:
+            try:
+                result = await GraffitiAI.call_backend(backend_key, *inputs)
+                if backend_key != model_key:
+                    fallbacks_total.inc(model=model_key, backend=backend_key)
+                return result, backend_key
+            except BackendUnavailable as unavailable:
+                logger.warning(f"⚡ تخطي النموذج: {unavailable}")
+            except Exception as api_error:
+                logger.error(f"❌ خطأ في API {AI_MODELS[backend_key]['name']}: {api_error}")
+        
+        raise BackendUnavailable("جميع النماذج غير متاحة حالياً")
     
     @staticmethod
     async def translate_to_english(text: str) -> str:
         """ترجمة النص من العربية إلى الإنجليزية باستخدام Gemini 2.0 Flash"""
         try:
-            # التحقق من وجود نموذج Gemini
-            if not gemini_model:
-                logger.warning("⚠️ نموذج Gemini غير متاح، سيتم استخدام النص كما هو")
-                return text
-            
             # التحقق إذا كان النص يحتوي على أحرف عربية
             arabic_pattern = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]')
             if not arabic_pattern.search(text):
                 # النص باللغة الإنجليزية بالفعل
                 return text
             
+            # استخدام ترجمة سابقة لنفس الوصف إن وجدت
+            cached = await translation_cache.get(text)
+            cache_requests.inc(cache="translation", result="hit" if cached else "miss")
+            if cached:
+                logger.info(f"⚡ ترجمة محفوظة: '{text}' -> '{cached}'")
+                return cached
+            
+            # التحقق من وجود نموذج Gemini
+            model = await get_gemini_model()
+            if not model:
+                logger.warning("⚠️ نموذج Gemini غير متاح، سيتم استخدام النص كما هو")
+                return text
+            
             # إنشاء prompt للترجمة
             translation_prompt = f"""
 You are a professional translator. Translate the following Arabic text to English for AI image generation.
@@ -340,14 +1778,16 @@ Instructions:
 English Translation:"""
             
             # إرسال الطلب لـ Gemini
-            response = await asyncio.to_thread(
-                gemini_model.generate_content, 
-                translation_prompt
-            )
+            with stage_seconds.time(stage="translate"):
+                response = await asyncio.to_thread(
+                    model.generate_content, 
+                    translation_prompt
+                )
             
             if response and response.text:
                 translated_text = response.text.strip()
                 logger.info(f"✅ تم ترجمة النص: '{text}' -> '{translated_text}'")
+                await translation_cache.put(text, translated_text)
                 return translated_text
             else:
                 logger.warning("⚠️ لم يتم الحصول على ترجمة، سيتم استخدام النص الأصلي")
@@ -359,91 +1799,101 @@ English Translation:"""
             return text
     
     @staticmethod
-    async def download_telegram_image(file_id: str, bot):
-        """تحميل وتحويل صورة من تليجرام إلى PIL Image"""
+    async def download_telegram_image(file_id: str, file_unique_id: str, bot):
+        """تحميل صورة من تليجرام كبايتات مضغوطة"""
         try:
-            file = await bot.get_file(file_id)
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(file.file_path) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-                        return Image.open(BytesIO(image_data))
-            return None
+            return await telegram_downloader.fetch(bot, file_id, file_unique_id)
         except Exception as e:
             logger.error(f"❌ خطأ في تحميل الصورة: {e}")
             return None
     
     @staticmethod
-    async def process_virtual_tryon(person_img, garment_img, model_key, garment_type="upper_body"):
-        """معالجة طلب تجربة الملابس الافتراضية"""
+    async def download_telegram_images(photos, bot):
+        """تحميل عدة صور من تليجرام بالتوازي، photos قائمة من (file_id, file_unique_id)"""
+        return await asyncio.gather(*(
+            GraffitiAI.download_telegram_image(file_id, file_unique_id, bot)
+            for file_id, file_unique_id in photos
+        ))
+    
+    @staticmethod
+    def resolve_result(result):
+        """استخراج مسار الملف المحلي أو الرابط من نتيجة Gradio (قد تكون قائمة مخرجات)"""
+        if isinstance(result, (list, tuple)):
+            if not result:
+                return None
+            result = result[0]
+        if isinstance(result, dict):
+            result = result.get("path") or result.get("url") or result.get("name")
+        if isinstance(result, str):
+            if result.startswith('http') or os.path.exists(result):
+                return result
+            return None
+        # قد تكون النتيجة ملفاً مباشراً
+        return result
+    
+    @staticmethod
+    async def read_result_bytes(result):
+        """قراءة بايتات نتيجة Gradio المحفوظة محلياً"""
+        result = GraffitiAI.resolve_result(result)
+        if isinstance(result, str) and os.path.exists(result):
+            def _read():
+                with open(result, 'rb') as f:
+                    return f.read()
+            with stage_seconds.time(stage="result_read"):
+                return await asyncio.to_thread(_read)
+        return None
+    
+    @staticmethod
+    async def preprocess_image(data: bytes, model_key: str) -> bytes:
+        """تجهيز الصورة لحجم النموذج في مجمع العمليات حتى لا تتعطل حلقة الأحداث"""
+        max_side = AI_MODELS[model_key].get("max_side")
+        if not max_side:
+            return data
         try:
-            # إنشاء عميل AI
-            client = await GraffitiAI.create_ai_client(model_key)
-            if not client:
-                return None, "❌ فشل في الاتصال بخدمة الذكاء الاصطناعي"
-            
-            # حفظ الصور مؤقتاً
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as person_file:
-                person_img.save(person_file.name, format='PNG')
-                person_path = person_file.name
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as garment_file:
-                garment_img.save(garment_file.name, format='PNG')
-                garment_path = garment_file.name
-              # تشغيل النموذج المناسب مع إعادة المحاولة
-            model_info = AI_MODELS[model_key]
-            result = None
+            with stage_seconds.time(stage="preprocess"):
+                return await image_process_pool.run(preprocess_photo, data, max_side, STAGING_JPEG_QUALITY)
+        except Exception as e:
+            # إرسال الصورة الأصلية إذا تعذرت المعالجة
+            logger.warning(f"⚠️ تعذرت معالجة الصورة مسبقاً: {e}")
+            return data
+    
+    @staticmethod
+    async def process_virtual_tryon(person_data: bytes, garment_data: bytes, model_key, garment_type="upper_body",
+                                    cache_key: str = None):
+        """معالجة طلب تجربة الملابس الافتراضية (cache_key يعني أن المستدعي بحث في الذاكرة مسبقاً)"""
+        try:
+            if cache_key is None:
+                # البحث عن نتيجة سابقة لنفس الصورتين والنموذج ونوع الملابس
+                cache_key = ResultCache.make_key(person_data, garment_data, model_key, garment_type)
+                cached = await result_cache.get(cache_key)
+                if cached is not None:
+                    logger.info("⚡ تم استرجاع النتيجة من الذاكرة")
+                    return cached, "✅ تم إنتاج النتيجة بنجاح!"
             
-            try:
-                if model_key == "g1_fast":
-                    # النموذج الأول: krsatyam7/Virtual_Clothing_Try-On-new
-                    result = client.predict(
-                        person_image=handle_file(person_path),
-                        clothing_image=handle_file(garment_path),
-                        api_name=model_info["api_endpoint"]
-                    )
-                else:  # g1_pro
-                    # النموذج الثاني: PawanratRung/virtual-try-on
-                    result = client.predict(
-                        handle_file(person_path),
-                        handle_file(garment_path),
-                        garment_type,
-                        api_name=model_info["api_endpoint"]
-                    )
-            except Exception as api_error:
-                logger.error(f"❌ خطأ في API: {api_error}")
-                # محاولة مع النموذج البديل
+            # الصورتان الأصليتان لمفتاح الذاكرة إن أنتج النتيجة نموذج بديل
+            source_data = (person_data, garment_data)
+            # تصغير الصورتين بالتوازي ثم تمريرهما إلى ملفات مؤقتة في الذاكرة
+            person_data, garment_data = await asyncio.gather(
+                GraffitiAI.preprocess_image(person_data, model_key),
+                GraffitiAI.preprocess_image(garment_data, model_key)
+            )
+            async with image_staging.stage(model_key, person_data, garment_data) as (person_path, garment_path):
                 try:
-                    if model_key == "g1_fast":
-                        # جرب النموذج البديل G1 Pro
-                        alt_client = Client("PawanratRung/virtual-try-on")
-                        result = alt_client.predict(
-                            handle_file(person_path),
-                            handle_file(garment_path),
-                            "upper_body",
-                            api_name="/virtual_tryon"
-                        )
-                    else:
-                        # جرب النموذج البديل G1 Fast
-                        alt_client = Client("krsatyam7/Virtual_Clothing_Try-On-new")
-                        result = alt_client.predict(
-                            person_image=handle_file(person_path),
-                            clothing_image=handle_file(garment_path),
-                            api_name="/swap_clothing"
+                    with stage_seconds.time(stage="tryon_predict"):
+                        result, backend_key = await GraffitiAI.dispatch(
+                            model_key, person_path, garment_path, garment_type, garment_type=garment_type
                         )
-                except Exception as fallback_error:
-                    logger.error(f"❌ فشل في النموذج البديل: {fallback_error}")
+                except BackendUnavailable:
                     return None, "❌ جميع النماذج غير متاحة حالياً، حاول لاحقاً"
             
-            # تنظيف الملفات المؤقتة
-            try:
-                os.unlink(person_path)
-                os.unlink(garment_path)
-            except:
-                pass
-            
             if result:
+                result_data = await GraffitiAI.read_result_bytes(result)
+                if result_data:
+                    # نتيجة البديل تُحفظ باسم النموذج الذي أنتجها، وإلا أعادت الذاكرة صورة نموذج آخر
+                    # لطلبات النموذج المطلوب حتى بعد عودته للعمل
+                    if backend_key != model_key:
+                        cache_key = ResultCache.make_key(*source_data, backend_key, garment_type)
+                    await result_cache.put(cache_key, result_data)
                 return result, "✅ تم إنتاج النتيجة بنجاح!"
             else:
                 return None, "❌ لم يتم إنتاج نتيجة"                
@@ -455,79 +1905,20 @@ English Translation:"""
     async def generate_image(prompt: str, width: int = 1024, height: int = 1024):
         """توليد صورة باستخدام الذكاء الاصطناعي"""
         try:
-            # إنشاء عميل توليد الصور
-            client = Client("black-forest-labs/FLUX.1-dev")
-            logger.info("✅ تم الاتصال بمولد الصور Graffiti G1-Image Generator")
-              # توليد الصورة
-            result = client.predict(
-                prompt=prompt,
-                seed=0,
-                randomize_seed=True,
-                width=width,
-                height=height,
-                guidance_scale=3.5,
-                num_inference_steps=28,
-                api_name="/infer"
-            )
+            # توليد الصورة
+            try:
+                with stage_seconds.time(stage="generation_predict"):
+                    result, _ = await GraffitiAI.dispatch("g1_image", prompt, width, height)
+            except BackendUnavailable:
+                return None, "❌ مولد الصور غير متاح مؤقتاً، حاول بعد قليل"
             
             if result:
                 logger.info("✅ تم توليد الصورة بنجاح")
                 
-                # التعامل مع أنواع مختلفة من النتائج
-                if isinstance(result, str):
-                    # إذا كان النتيجة URL
-                    if result.startswith('http'):
-                        try:
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(result) as response:
-                                    if response.status == 200:
-                                        image_data = await response.read()
-                                        return BytesIO(image_data), "✅ تم توليد الصورة بنجاح!"
-                                    else:
-                                        return None, "❌ فشل في تحميل الصورة المولدة"
-                        except Exception as download_error:
-                            logger.error(f"❌ خطأ في تحميل الصورة من URL: {download_error}")
-                            return None, "❌ فشل في تحميل الصورة المولدة"
-                    
-                    # إذا كان النتيجة مسار ملف محلي
-                    elif os.path.exists(result):
-                        try:
-                            with open(result, 'rb') as f:
-                                image_data = f.read()
-                            return BytesIO(image_data), "✅ تم توليد الصورة بنجاح!"
-                        except Exception as file_error:
-                            logger.error(f"❌ خطأ في قراءة الملف: {file_error}")
-                            return None, "❌ فشل في قراءة الصورة المولدة"
-                
-                # إذا كان النتيجة قائمة (multiple outputs)
-                elif isinstance(result, (list, tuple)) and len(result) > 0:
-                    # أخذ أول نتيجة
-                    first_result = result[0]
-                    if isinstance(first_result, str):
-                        if first_result.startswith('http'):
-                            try:
-                                async with aiohttp.ClientSession() as session:
-                                    async with session.get(first_result) as response:
-                                        if response.status == 200:
-                                            image_data = await response.read()
-                                            return BytesIO(image_data), "✅ تم توليد الصورة بنجاح!"
-                            except Exception as download_error:
-                                logger.error(f"❌ خطأ في تحميل الصورة من URL: {download_error}")
-                        elif os.path.exists(first_result):
-                            try:
-                                with open(first_result, 'rb') as f:
-                                    image_data = f.read()
-                                return BytesIO(image_data), "✅ تم توليد الصورة بنجاح!"
-                            except Exception as file_error:
-                                logger.error(f"❌ خطأ في قراءة الملف: {file_error}")
-                    else:
-                        # قد يكون ملف مباشر
-                        return first_result, "✅ تم توليد الصورة بنجاح!"
-                
-                # محاولة أخيرة - إذا كان النتيجة ملف مباشر
-                else:
-                    return result, "✅ تم توليد الصورة بنجاح!"
-                    
+                # تمرير المسار المحلي أو الرابط كما هو دون قراءة الصورة في الذاكرة
+                image_ref = GraffitiAI.resolve_result(result)
+                if image_ref:
+                    return image_ref, "✅ تم توليد الصورة بنجاح!"
                 return None, "❌ تعذر معالجة الصورة المولدة"
             else:
                 return None, "❌ لم يتم توليد الصورة"
@@ -539,6 +1930,66 @@ English Translation:"""
 class TelegramHandlers:
     """معالجات رسائل تليجرام"""
     
+    @staticmethod
+    async def update_status(message, header: str, stages):
+        """تحديث رسالة المعالجة بالمراحل المكتملة"""
+        try:
+            await message.edit_text(header + "\n" + "\n".join(stages), parse_mode='HTML')
+        except Exception as e:
+            # فشل التحديث لا يجب أن يوقف المعالجة
+            logger.debug(f"تعذر تحديث رسالة المعالجة: {e}")
+    
+    @staticmethod
+    async def download_to_spool(url: str):
+        """تحميل رابط على دفعات صغيرة إلى ملف مؤقت يبقى في الذاكرة حتى حد معين"""
+        spool = tempfile.SpooledTemporaryFile(max_size=RESULT_SPOOL_BYTES, dir=STAGING_DIR)
+        try:
+            with stage_seconds.time(stage="result_download"):
+                async with http_session.session.get(url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(RESULT_CHUNK_BYTES):
+                        spool.write(chunk)
+            spool.seek(0)
+            return spool
+        except Exception:
+            spool.close()
+            raise
+    
+    @staticmethod
+    async def send_result_photo(bot, chat_id: int, photo, **kwargs):
+        """إرسال صورة مع إعادة استخدام file_id إذا سبق رفع نفس الصورة"""
+        with stage_seconds.time(stage="send_photo"):
+            return await TelegramHandlers._send_result_photo(bot, chat_id, photo, **kwargs)
+    
+    @staticmethod
+    async def _send_result_photo(bot, chat_id: int, photo, **kwargs):
+        digest = await FileIdCache.digest(photo)
+        file_id = file_id_cache.get(digest) if digest else None
+        if digest:
+            cache_requests.inc(cache="file_id", result="hit" if file_id else "miss")
+        if file_id:
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            except BadRequest as e:
+                # المعرف لم يعد صالحاً، نعيد رفع الصورة
+                logger.warning(f"⚠️ تعذر استخدام file_id المحفوظ: {e}")
+                file_id_cache.discard(digest)
+        
+        if isinstance(photo, str) and photo.startswith('http'):
+            try:
+                # يجلب تليجرام الصورة من الرابط مباشرة دون مرورها عبر البوت
+                return await bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+            except BadRequest as e:
+                logger.warning(f"⚠️ تعذر على تليجرام جلب الرابط، سيتم رفع الصورة: {e}")
+                with await TelegramHandlers.download_to_spool(photo) as spool:
+                    return await bot.send_photo(chat_id=chat_id, photo=spool, **kwargs)
+        
+        # المسارات المحلية تُفتح وتُرفع مباشرة دون نسخة وسيطة في BytesIO
+        message = await bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+        if digest and message.photo:
+            file_id_cache.put(digest, message.photo[-1].file_id)
+        return message
+    
     @staticmethod
     async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """أمر البداية"""
@@ -546,7 +1997,8 @@ class TelegramHandlers:
         user_id = user.id
         
         # إعادة تعيين جلسة المستخدم
-        user_sessions[user_id] = {}        
+        await session_store.reset(user_id)
+        
         keyboard = [
             [InlineKeyboardButton("🎨 تجربة الملابس الافتراضية", callback_data="start_tryon")],
             [InlineKeyboardButton("🖼️ مولد الصور الذكي", callback_data="start_image_gen")],
@@ -719,34 +2171,26 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
         """بدء تجربة الملابس الافتراضية"""
         user_id = update.callback_query.from_user.id
         
-        user_sessions[user_id] = {
-            "mode": "virtual_tryon",
-            "step": "select_model"
-        }
+        await session_store.create(user_id, mode="virtual_tryon", step="select_model")
+        # إيقاظ نماذج تجربة الملابس أثناء اختيار المستخدم
+        space_keep_alive.wake(*TRYON_MODELS)
         
         keyboard = [
-            [InlineKeyboardButton("🔥 Graffiti G1 Fast", callback_data="select_model_g1_fast")],
-            [InlineKeyboardButton("🚀 Graffiti G1 Pro", callback_data="select_model_g1_pro")],
-            [InlineKeyboardButton("🔙 العودة", callback_data="main_menu")]
+            [InlineKeyboardButton(AI_MODELS[model_key]["button"], callback_data=f"select_model_{model_key}")]
+            for model_key in TRYON_MODELS
         ]
+        keyboard.append([InlineKeyboardButton("🔙 العودة", callback_data="main_menu")])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        model_text = """
-🎨 <b>اختر نموذج Graffiti AI</b>
-
-<b>🔥 Graffiti G1 Fast:</b>
-• معالجة سريعة ومحسنة
-• مناسب للاستخدام اليومي
-• نتائج عالية الجودة
-
-<b>🚀 Graffiti G1 Pro:</b>
-• نموذج متقدم ومتطور
-• دعم أنواع ملابس متعددة
-• دقة عالية جداً
-• خيارات تخصيص أكثر
-
-👇 <b>اختر النموذج المناسب:</b>
-        """
+        # وصف النماذج من السجل حتى يظهر أي نموذج جديد دون تعديل النص
+        model_text = "\n🎨 <b>اختر نموذج Graffiti AI</b>\n\n"
+        for model_key in TRYON_MODELS:
+            model_info = AI_MODELS[model_key]
+            features = model_info.get("features") or (model_info["description"],)
+            model_text += f"<b>{model_info['button']}:</b>\n"
+            model_text += "".join(f"• {feature}\n" for feature in features)
+            model_text += "\n"
+        model_text += "👇 <b>اختر النموذج المناسب:</b>\n"
         
         await update.callback_query.edit_message_text(
             model_text, parse_mode='HTML', reply_markup=reply_markup
@@ -756,19 +2200,30 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
     async def model_selected(update: Update, context: ContextTypes.DEFAULT_TYPE, model_key: str):
         """تم اختيار النموذج"""
         user_id = update.callback_query.from_user.id
-        user_sessions[user_id]["model"] = model_key
-        user_sessions[user_id]["step"] = "upload_person"
+        if model_key not in TRYON_MODELS:
+            logger.warning(f"⚠️ نموذج تجربة غير معروف: {model_key}")
+            await TelegramHandlers.start_virtual_tryon(update, context)
+            return
+        session = await session_store.get(user_id) or UserSession(mode="virtual_tryon")
+        session.model = model_key
+        session.step = "upload_person"
+        # إيقاظ النموذج المختار وبدائله قبل وصول الصور
+        space_keep_alive.wake(model_key, *AI_MODELS[model_key].get("fallbacks", ()))
+        garment_types = AI_MODELS[model_key]["garment_types"]
+        if len(garment_types) == 1:
+            session.garment_type = garment_types[0]
+        await session_store.save(user_id, session)
         
         model_name = AI_MODELS[model_key]["name"]
         
-        if model_key == "g1_pro":
-            # للنموذج المتقدم، اختر نوع الملابس أولاً
+        if len(garment_types) > 1:
+            # للنماذج التي تدعم عدة أنواع ملابس، اختر نوع الملابس أولاً
             keyboard = [
-                [InlineKeyboardButton("👕 ملابس علوية", callback_data="garment_upper")],
-                [InlineKeyboardButton("👖 ملابس سفلية", callback_data="garment_lower")],
-                [InlineKeyboardButton("👗 فساتين", callback_data="garment_dress")],
-                [InlineKeyboardButton("🔙 تغيير النموذج", callback_data="start_tryon")]
+                [InlineKeyboardButton(type_info["button"], callback_data=f"garment_{type_key}")]
+                for type_key, type_info in GARMENT_TYPES.items()
+                if type_info["id"] in garment_types
             ]
+            keyboard.append([InlineKeyboardButton("🔙 تغيير النموذج", callback_data="start_tryon")])
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             await update.callback_query.edit_message_text(
@@ -778,7 +2233,7 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
                 reply_markup=reply_markup
             )
         else:
-            # للنموذج السريع، انتقل مباشرة لرفع صورة الشخص
+            # للنماذج ذات النوع الواحد، انتقل مباشرة لرفع صورة الشخص
             keyboard = [
                 [InlineKeyboardButton("🔙 تغيير النموذج", callback_data="start_tryon")]
             ]
@@ -799,12 +2254,23 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
     async def garment_type_selected(update: Update, context: ContextTypes.DEFAULT_TYPE, garment_type: str):
         """تم اختيار نوع الملابس"""
         user_id = update.callback_query.from_user.id
-        user_sessions[user_id]["garment_type"] = GARMENT_TYPES[garment_type]["id"]
-        user_sessions[user_id]["step"] = "upload_person"
+        session = await session_store.get(user_id)
+        # رفض الأنواع التي لا يدعمها النموذج المختار (أزرار قديمة أو بيانات معدلة)
+        if session is None or session.model not in TRYON_MODELS:
+            await TelegramHandlers.start_virtual_tryon(update, context)
+            return
+        type_info = GARMENT_TYPES.get(garment_type)
+        if type_info is None or type_info["id"] not in AI_MODELS[session.model]["garment_types"]:
+            logger.warning(f"⚠️ نوع ملابس غير مدعوم للنموذج {session.model}: {garment_type}")
+            await TelegramHandlers.model_selected(update, context, session.model)
+            return
+        session.garment_type = type_info["id"]
+        session.step = "upload_person"
+        await session_store.save(user_id, session)
         
-        type_name = GARMENT_TYPES[garment_type]["name"]
+        type_name = type_info["name"]
         keyboard = [
-            [InlineKeyboardButton("🔙 تغيير النوع", callback_data="select_model_g1_pro")]
+            [InlineKeyboardButton("🔙 تغيير النوع", callback_data=f"select_model_{session.model}")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -824,55 +2290,91 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
         """معالجة الصور المرسلة"""
         user_id = update.effective_user.id
         
-        if user_id not in user_sessions or user_sessions[user_id].get("mode") != "virtual_tryon":
+        session = await session_store.get(user_id)
+        if session is None or session.mode != "virtual_tryon":
             await update.message.reply_text("🎨 لبدء تجربة الملابس، استخدم الأمر /start")
             return
         
-        session = user_sessions[user_id]
         photo = update.message.photo[-1]
         
         await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
         
-        if session.get("step") == "upload_person":
-            # رفع صورة الشخص
-            image = await GraffitiAI.download_telegram_image(photo.file_id, context.bot)
-            if image:
-                session["person_image"] = image
-                session["step"] = "upload_garment"
-                
-                await update.message.reply_text(
-                    "✅ تم حفظ صورة الشخص!\n\n"
-                    "👕 الآن أرسل صورة الملابس التي تريد تجربتها\n\n"
-                    "💡 <b>نصائح للملابس:</b>\n"
-                    "• خلفية بيضاء أو بسيطة\n"
-                    "• ملابس واضحة ومفصلة\n"
-                    "• تجنب الظلال القوية",
-                    parse_mode='HTML'
-                )
-            else:
-                await update.message.reply_text("❌ فشل في معالجة الصورة. حاول مرة أخرى.")
+        if photo.file_size and photo.file_size > MAX_IMAGE_BYTES:
+            await update.message.reply_text("❌ حجم الصورة كبير جداً. أرسل صورة أصغر.")
+            return
         
-        elif session.get("step") == "upload_garment":
-            # رفع صورة الملابس ومعالجة الطلب
-            image = await GraffitiAI.download_telegram_image(photo.file_id, context.bot)
-            if image:
-                session["garment_image"] = image
-                session["step"] = "processing"
+        if session.step == "upload_person":
+            # رفع صورة الشخص: يبدأ التحميل في الخلفية بينما يرسل المستخدم صورة الملابس
+            session.person_file_id = photo.file_id
+            session.person_unique_id = photo.file_unique_id
+            session.step = "upload_garment"
+            await session_store.save(user_id, session)
+            telegram_downloader.prefetch(context.bot, photo.file_id, photo.file_unique_id)
+            
+            await update.message.reply_text(
+                "✅ تم حفظ صورة الشخص!\n\n"
+                "👕 الآن أرسل صورة الملابس التي تريد تجربتها\n\n"
+                "💡 <b>نصائح للملابس:</b>\n"
+                "• خلفية بيضاء أو بسيطة\n"
+                "• ملابس واضحة ومفصلة\n"
+                "• تجنب الظلال القوية",
+                parse_mode='HTML'
+            )
+        
+        elif session.step == "upload_garment":
+            # رفع صورة الملابس وتحميل الصورتين بالتوازي
+            person_data, garment_data = await GraffitiAI.download_telegram_images(
+                [
+                    (session.person_file_id, session.person_unique_id),
+                    (photo.file_id, photo.file_unique_id)
+                ],
+                context.bot
+            )
+            if person_data and garment_data:
+                session.garment_file_id = photo.file_id
+                session.garment_unique_id = photo.file_unique_id
+                session.step = "processing"
+                await session_store.save(user_id, session)
                 
-                processing_msg = await update.message.reply_text(
+                processing_header = (
                     "⚡ <b>Graffiti AI يعمل...</b>\n\n"
                     "🔄 جاري معالجة طلبك\n"
-                    "⏳ هذا قد يستغرق بضع ثوانٍ",
-                    parse_mode='HTML'
+                    "⏳ هذا قد يستغرق بضع ثوانٍ\n"
                 )
+                processing_msg = await update.message.reply_text(processing_header, parse_mode='HTML')
                 
-                # معالجة تجربة الملابس
-                result, status = await GraffitiAI.process_virtual_tryon(
-                    session["person_image"],
-                    session["garment_image"],
-                    session["model"],
-                    session.get("garment_type", "upper_body")
-                )
+                model_key = session.model
+                garment_type = session.garment_type or "upper_body"
+                
+                async def show_position(position: int):
+                    await TelegramHandlers.update_status(
+                        processing_msg, processing_header, [f"📋 ترتيبك في الطابور: {position}"]
+                    )
+                
+                # النتائج المحفوظة لا تحتاج المرور بالطابور
+                cache_key = ResultCache.make_key(person_data, garment_data, model_key, garment_type)
+                cached = await result_cache.get(cache_key)
+                cache_requests.inc(cache="result", result="miss" if cached is None else "hit")
+                try:
+                    if cached is not None:
+                        result, status = cached, "✅ تم إنتاج النتيجة بنجاح!"
+                    else:
+                        # معالجة تجربة الملابس عبر طابور المهام
+                        result, status = await job_scheduler.run(
+                            user_id,
+                            model_key,
+                            lambda: GraffitiAI.process_virtual_tryon(
+                                person_data, garment_data, model_key, garment_type, cache_key=cache_key
+                            ),
+                            on_position=show_position
+                        )
+                except JobRejected as e:
+                    # إبقاء الجلسة ليتمكن المستخدم من إعادة إرسال صورة الملابس
+                    await processing_msg.delete()
+                    session.step = "upload_garment"
+                    await session_store.save(user_id, session)
+                    await update.message.reply_text(str(e))
+                    return
                 
                 await processing_msg.delete()
                 
@@ -883,9 +2385,10 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
                     ]
                     reply_markup = InlineKeyboardMarkup(keyboard)
                     
-                    model_name = AI_MODELS[session["model"]]["name"]
+                    model_name = AI_MODELS[model_key]["name"]
                     
-                    await context.bot.send_photo(
+                    await TelegramHandlers.send_result_photo(
+                        context.bot,
                         chat_id=update.effective_chat.id,
                         photo=result,
                         caption=f"🎨 <b>Graffiti AI - النتيجة</b>\n\n"
@@ -912,8 +2415,14 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
                     )
                 
                 # إعادة تعيين الجلسة
-                user_sessions[user_id] = {}
-            else:                await update.message.reply_text("❌ فشل في معالجة صورة الملابس. حاول مرة أخرى.")
+                await session_store.reset(user_id)
+            elif not person_data:
+                # إعادة طلب صورة الشخص إذا فشل تحميلها
+                session.step = "upload_person"
+                await session_store.save(user_id, session)
+                await update.message.reply_text("❌ فشل في معالجة صورة الشخص. أرسلها مرة أخرى.")
+            else:
+                await update.message.reply_text("❌ فشل في معالجة صورة الملابس. حاول مرة أخرى.")
     
     @staticmethod
     async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -921,8 +2430,9 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
         user_id = update.effective_user.id
         
         # التحقق من وضع توليد الصور
-        if user_id in user_sessions and user_sessions[user_id].get("mode") == "image_generation":
-            if user_sessions[user_id].get("step") == "waiting_prompt":
+        session = await session_store.get(user_id)
+        if session is not None and session.mode == "image_generation":
+            if session.step == "waiting_prompt":
                 prompt = update.message.text
                 await TelegramHandlers.handle_image_generation_text(update, context, prompt)
                 return
@@ -938,10 +2448,8 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
         """بدء توليد الصور بالذكاء الاصطناعي"""
         user_id = update.callback_query.from_user.id
         
-        user_sessions[user_id] = {
-            "mode": "image_generation",
-            "step": "waiting_prompt"
-        }
+        await session_store.create(user_id, mode="image_generation", step="waiting_prompt")
+        space_keep_alive.wake("g1_image")
         
         keyboard = [
             [InlineKeyboardButton("🔙 العودة للقائمة الرئيسية", callback_data="main_menu")]
@@ -980,19 +2488,50 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
         user_id = update.effective_user.id
         
         # إرسال رسالة المعالجة
-        processing_msg = await update.message.reply_text(
+        processing_header = (
             "🖼️ <b>Graffiti G1-Image Generator يعمل...</b>\n\n"
-           
             "🎨 جاري إنشاء صورتك الفنية\n"
-            "⏳ هذا قد يستغرق 30-60 ثانية\n",
-            parse_mode='HTML'
+            "⏳ هذا قد يستغرق 30-60 ثانية\n"
         )
+        processing_msg = await update.message.reply_text(processing_header, parse_mode='HTML')
         
-        # ترجمة النص إلى الإنجليزية باستخدام Gemini
-        english_prompt = await GraffitiAI.translate_to_english(prompt)
+        # الترجمة والاتصال بمولد الصور مستقلان، لذا يعملان بالتوازي
+        translate_task = asyncio.create_task(GraffitiAI.translate_to_english(prompt))
+        connect_task = asyncio.create_task(client_pool.get("g1_image"))
+        stages = []
+        pending = {translate_task, connect_task}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is translate_task:
+                    stages.append("✅ تم تجهيز الوصف")
+                elif task.exception() is None:
+                    stages.append("✅ تم الاتصال بمولد الصور")
+                else:
+                    # سيعيد generate_image محاولة الاتصال ويعرض الخطأ
+                    logger.warning(f"⚠️ فشل الاتصال المسبق بمولد الصور: {task.exception()}")
+            await TelegramHandlers.update_status(processing_msg, processing_header, stages)
         
-        # توليد الصورة
-        result, status = await GraffitiAI.generate_image(english_prompt)
+        english_prompt = translate_task.result()
+        
+        # توليد الصورة عبر طابور المهام
+        stages.append("🎨 جاري توليد الصورة...")
+        await TelegramHandlers.update_status(processing_msg, processing_header, stages)
+        
+        async def show_position(position: int):
+            await TelegramHandlers.update_status(
+                processing_msg, processing_header, stages + [f"📋 ترتيبك في الطابور: {position}"]
+            )
+        
+        try:
+            result, status = await job_scheduler.run(
+                user_id,
+                "g1_image",
+                lambda: GraffitiAI.generate_image(english_prompt),
+                on_position=show_position
+            )
+        except JobRejected as e:
+            result, status = None, str(e)
         
         await processing_msg.delete()
         
@@ -1016,7 +2555,8 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
                              f"📝 الوصف: {prompt}\n" \
                              f"🎨 تم إنشاء هذه الصورة بتقنية الذكاء الاصطناعي المتطورة!"
                 
-                await context.bot.send_photo(
+                await TelegramHandlers.send_result_photo(
+                    context.bot,
                     chat_id=update.effective_chat.id,
                     photo=result,
                     caption=caption,
@@ -1050,28 +2590,147 @@ Graffiti AI هو بوت ذكي متطور يستخدم أحدث تقنيات ا
             )
         
         # إعادة تعيين الجلسة
-        user_sessions[user_id] = {}
+        await session_store.reset(user_id)
+
+async def collect_runtime_metrics():
+    """تحديث القيم اللحظية (الطوابير والجلسات وقواطع الدائرة) قبل كل قراءة للمقاييس"""
+    for model_key, breaker in circuit_breakers.items():
+        queue_depth_gauge.set(job_scheduler.queue_depth(model_key), backend=model_key)
+        breaker_state_gauge.set(
+            {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 0.5, CircuitBreaker.OPEN: 1}[breaker.state],
+            backend=model_key
+        )
+    sessions_gauge.set(await session_store.count())
+
+metrics.registry.add_collector(collect_runtime_metrics)
+# خادم المقاييس المحلي
+metrics_server = metrics.MetricsServer()
+
+# مهمة التسخين في الخلفية (تُلغى عند الإيقاف إن لم تنته)
+warm_up_task = None
+
+async def warm_up_services():
+    """تسخين Gemini ونماذج Gradio في الخلفية بعد بدء الاستقبال مع تسجيل أزمنتها"""
+    async def warm_up_gemini():
+        await get_gemini_model()
+        mark_startup("gemini_ready")
+    
+    async def warm_up_backends():
+        await client_pool.warm_up()
+        mark_startup("backends_ready")
+    
+    await asyncio.gather(warm_up_gemini(), warm_up_backends())
+
+async def post_init(application: Application):
+    """تهيئة الموارد المشتركة بعد إنشاء التطبيق"""
+    await http_session.start()
+    await job_scheduler.start()
+    session_store.start()
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        # تعارض المنفذ لا يجب أن يمنع البوت من العمل
+        logger.warning(f"⚠️ تعذر تشغيل خادم المقاييس: {e}")
+    space_keep_alive.start()
+    mark_startup("ready")
+    # الاتصال المسبق بنماذج AI و Gemini في الخلفية حتى لا يتأخر بدء الاستقبال؛
+    # application.create_task يحذر داخل post_init قبل تشغيل التطبيق، لذا نحتفظ بالمهمة بأنفسنا
+    global warm_up_task
+    warm_up_task = asyncio.create_task(warm_up_services())
+
+async def post_shutdown(application: Application):
+    """تحرير الموارد المشتركة عند إيقاف التطبيق"""
+    global warm_up_task
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+        await asyncio.gather(warm_up_task, return_exceptions=True)
+        warm_up_task = None
+    await metrics_server.stop()
+    await space_keep_alive.stop()
+    await job_scheduler.stop()
+    await session_store.stop()
+    await http_session.close()
+    translation_cache.close()
+    predict_executor.shutdown()
+    image_process_pool.shutdown()
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """معالجة التحديثات بالتوازي مع الحفاظ على ترتيب تحديثات المحادثة الواحدة"""
+    
+    def __init__(self, max_concurrent_updates: int):
+        # حد PTB يُؤخذ قبل do_process_update، فالتحديثات المنتظرة لقفل محادثتها كانت ستحجز أماكن
+        # المحادثات الأخرى؛ لذا نعطي PTB حداً كبيراً ونطبق الحد الفعلي بعد قفل المحادثة
+        super().__init__(sys.maxsize)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks = {}
+        self._chat_waiters = {}
+    
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._slots:
+                await coroutine
+            return
+        
+        lock = self._chat_locks.get(chat.id)
+        if lock is None:
+            lock = self._chat_locks[chat.id] = asyncio.Lock()
+        self._chat_waiters[chat.id] = self._chat_waiters.get(chat.id, 0) + 1
+        try:
+            # صورة الشخص ثم صورة الملابس من نفس المستخدم تُعالجان بالترتيب
+            async with lock:
+                async with self._slots:
+                    await coroutine
+        finally:
+            self._chat_waiters[chat.id] -= 1
+            if not self._chat_waiters[chat.id]:
+                del self._chat_waiters[chat.id]
+                del self._chat_locks[chat.id]
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+
+def build_application() -> Application:
+    """إنشاء التطبيق وتسجيل المعالجات"""
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL)
+    if TELEGRAM_FILE_URL:
+        builder = builder.base_file_url(TELEGRAM_FILE_URL)
+    app = builder.build()
+    
+    # إضافة المعالجات
+    app.add_handler(CommandHandler("start", TelegramHandlers.start_command))
+    app.add_handler(CommandHandler("help", TelegramHandlers.help_command))
+    app.add_handler(CommandHandler("about", TelegramHandlers.about_command))
+    
+    app.add_handler(CallbackQueryHandler(TelegramHandlers.handle_callback))
+    app.add_handler(MessageHandler(filters.PHOTO, TelegramHandlers.handle_photo))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, TelegramHandlers.handle_text))
+    
+    # إضافة معالج الأخطاء
+    async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+        logger.error("Exception while handling an update:", exc_info=context.error)
+    
+    app.add_error_handler(error_handler)
+    return app
+
+mark_startup("imported")
 
 def main():
     """تشغيل البوت"""
     try:
         # إنشاء التطبيق
-        app = Application.builder().token(TELEGRAM_TOKEN).build()
-        
-        # إضافة المعالجات
-        app.add_handler(CommandHandler("start", TelegramHandlers.start_command))
-        app.add_handler(CommandHandler("help", TelegramHandlers.help_command))
-        app.add_handler(CommandHandler("about", TelegramHandlers.about_command))
-        
-        app.add_handler(CallbackQueryHandler(TelegramHandlers.handle_callback))
-        app.add_handler(MessageHandler(filters.PHOTO, TelegramHandlers.handle_photo))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, TelegramHandlers.handle_text))
-        
-        # إضافة معالج الأخطاء
-        async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
-            logger.error("Exception while handling an update:", exc_info=context.error)
-        
-        app.add_error_handler(error_handler)
+        app = build_application()
         
         # رسائل بدء التشغيل
         logger.info("🎨 Graffiti AI Bot Started Successfully!")
@@ -1088,7 +2747,26 @@ def main():
         print("=" * 50)
         
         # تشغيل البوت
-        app.run_polling(drop_pending_updates=True)
+        if BOT_MODE == "webhook":
+            if not WEBHOOK_URL:
+                raise ValueError("❌ WEBHOOK_URL مطلوب عند استخدام BOT_MODE=webhook")
+            # بدون الرمز السري يستطيع أي شخص يعرف الرابط إرسال تحديثات مزورة باسم أي مستخدم
+            if not WEBHOOK_SECRET:
+                raise ValueError("❌ WEBHOOK_SECRET مطلوب عند استخدام BOT_MODE=webhook")
+            # run_webhook يسجل الرابط لدى Bot API (يحترم TELEGRAM_API_URL) ويتحقق من الرمز السري،
+            # ويستدعي post_init/post_shutdown ويتعامل مع إشارات الإيقاف كما في run_polling
+            app.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH.lstrip('/'),
+                webhook_url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                # الإبقاء على التحديثات المعلقة حتى لا تضيع رسائل المستخدمين عند إعادة التشغيل
+                drop_pending_updates=False
+            )
+        else:
+            app.run_polling(drop_pending_updates=True)
         
     except Exception as e:
         logger.error(f"❌ خطأ في تشغيل البوت: {e}")
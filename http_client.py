@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+جلسة HTTP مشتركة لجميع الاتصالات الصادرة
+Shared aiohttp session for all outbound HTTP
+"""
+
+import os
+import aiohttp
+
+# إعدادات مجمع الاتصالات
+HTTP_CONNECTION_LIMIT = int(os.getenv('HTTP_CONNECTION_LIMIT', '100'))
+HTTP_LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', '20'))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30'))
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))
+
+# المهل الزمنية (بالثواني)
+HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', '120'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '60'))
+
+def create_http_session() -> aiohttp.ClientSession:
+    """إنشاء جلسة aiohttp مع مجمع اتصالات مضبوط"""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_CONNECTION_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=HTTP_TOTAL_TIMEOUT,
+        connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+class SharedHttpSession:
+    """حامل جلسة HTTP واحدة على مستوى التطبيق"""
+
+    def __init__(self):
+        self._session = None
+
+    async def start(self):
+        """إنشاء الجلسة (يُستدعى من post_init)"""
+        if self._session is None or self._session.closed:
+            self._session = create_http_session()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # إنشاء الجلسة عند الحاجة إذا استُخدمت قبل post_init
+        if self._session is None or self._session.closed:
+            self._session = create_http_session()
+        return self._session
+
+    async def close(self):
+        """إغلاق الجلسة وتحرير الاتصالات (يُستدعى عند الإيقاف)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+اختبار حمل دون اتصال بالإنترنت لمعالجات البوت
+Offline load test for the bot handlers
+
+يشغّل خادم Bot API وهمياً في عملية منفصلة، ويستبدل عملاء Gradio ونموذج Gemini
+ببدائل محلية بزمن استجابة ونسبة فشل قابلين للضبط، ثم يعيد تشغيل تدفقات مستخدمين
+اصطناعية (صور تجربة ملابس، أوصاف عربية وإنجليزية، ضغطات أزرار) عبر build_application().
+افتراضياً تمر التحديثات بالمسار الحقيقي: تُحقن في الخادم الوهمي ويجلبها Updater عبر getUpdates؛
+ومع --transport direct تُمرر مباشرة إلى update_processor لقياس المعالجات وحدها.
+
+مثال:
+    python load_test.py --sessions 300 --concurrency 60 --gradio-latency 2 --json report.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+import concurrent.futures
+from io import BytesIO
+from types import SimpleNamespace
+
+STUB_TOKEN = "123456:LOADTEST"
+STUB_BOT_ID = 123456
+
+# التدفقات المتاحة ونسبها الافتراضية
+DEFAULT_MIX = "tryon_fast=3,tryon_pro=2,generate_ar=2,generate_en=1,browse=2"
+
+ARABIC_PROMPTS = [
+    "قطة برتقالية تجلس على نافذة عند الغروب",
+    "مدينة مستقبلية مضيئة في الليل",
+    "غابة ضبابية مع نهر صغير",
+    "رائد فضاء يركب حصاناً على القمر",
+    "مقهى دافئ في يوم ممطر",
+]
+ENGLISH_PROMPTS = [
+    "an orange cat sitting on a window at sunset",
+    "a futuristic city glowing at night",
+    "a foggy forest with a small river",
+    "an astronaut riding a horse on the moon",
+    "a cozy cafe on a rainy day",
+]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def make_jpeg(width: int, height: int) -> bytes:
+    """صورة JPEG اصطناعية بضوضاء حتى يقترب حجمها من صور الهواتف"""
+    from PIL import Image
+    image = Image.effect_noise((width, height), 48).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(q * len(ordered)))
+    return ordered[index]
+
+# ---------------------------------------------------------------------------
+# خادم Bot API الوهمي (يعمل في عملية منفصلة حتى لا يشارك حلقة أحداث البوت)
+# ---------------------------------------------------------------------------
+
+def run_telegram_stub(port: int, latency: float, failure_rate: float, photo_size, ready):
+    from aiohttp import web
+
+    photo = make_jpeg(*photo_size)
+    counters = {"requests": {}, "failures": 0}
+    message_ids = iter(range(1, 1 << 62))
+    # التحديثات المحقونة بانتظار getUpdates؛ الخادم يرقمها بالترتيب كما يفعل تليجرام
+    inbox = []
+    update_ids = iter(range(1, 1 << 62))
+    arrived = asyncio.Event()
+
+    def message(chat_id, **fields):
+        return {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+            **fields
+        }
+
+    async def get_updates(form) -> list:
+        offset = int(form.get("offset") or 0)
+        inbox[:] = [update for update in inbox if update["update_id"] >= offset]
+        if not inbox:
+            arrived.clear()
+            try:
+                await asyncio.wait_for(arrived.wait(), float(form.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return inbox[:int(form.get("limit") or 100)]
+
+    async def handle_method(request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        form = await request.post()
+        counters["requests"][method] = counters["requests"].get(method, 0) + 1
+        if latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * latency)
+        if method == "getUpdates":
+            # بلا أخطاء مصطنعة: إعادة المحاولة في Updater تخفي زمن التحديث الحقيقي
+            return web.json_response({"ok": True, "result": await get_updates(form)})
+        if method != "getMe" and random.random() < failure_rate:
+            counters["failures"] += 1
+            return web.json_response(
+                {"ok": False, "error_code": 500, "description": "Internal Server Error: stub failure"},
+                status=500
+            )
+
+        chat_id = form.get("chat_id")
+        if method == "getMe":
+            result = {
+                "id": STUB_BOT_ID, "is_bot": True, "first_name": "Graffiti",
+                "username": "graffiti_stub_bot", "can_join_groups": False,
+                "can_read_all_group_messages": False, "supports_inline_queries": False
+            }
+        elif method == "getFile":
+            file_id = form.get("file_id")
+            result = {
+                "file_id": file_id, "file_unique_id": file_id,
+                "file_size": len(photo) + len(file_id), "file_path": f"photos/{file_id}.jpg"
+            }
+        elif method == "sendPhoto":
+            result = message(chat_id, photo=[{
+                "file_id": f"result-{next(message_ids)}", "file_unique_id": f"r{next(message_ids)}",
+                "width": 1024, "height": 1024
+            }])
+        elif method in ("sendMessage", "editMessageText"):
+            result = message(chat_id, text=form.get("text", ""))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(request: web.Request) -> web.Response:
+        # إلحاق معرف الملف بعد نهاية JPEG يجعل محتوى كل صورة فريداً دون تكلفة ترميز
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        return web.Response(body=photo + file_id.encode(), content_type="image/jpeg")
+
+    async def handle_stats(request: web.Request) -> web.Response:
+        return web.json_response(counters)
+
+    async def handle_inject(request: web.Request) -> web.Response:
+        update = await request.json()
+        update["update_id"] = next(update_ids)
+        inbox.append(update)
+        arrived.set()
+        return web.json_response({"update_id": update["update_id"]})
+
+    async def on_startup(app):
+        ready.set()
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_post("/inject", handle_inject)
+    app.router.add_get("/file/bot{token}/{path:.+}", handle_file)
+    app.router.add_post("/bot{token}/{method}", handle_method)
+    app.on_startup.append(on_startup)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+# ---------------------------------------------------------------------------
+# بدائل Gradio و Gemini داخل العملية
+# ---------------------------------------------------------------------------
+
+class StubJob:
+    """مهمة Gradio وهمية تدعم الإلغاء مثل Job الحقيقية"""
+
+    def __init__(self, latency: float, fail: bool, result):
+        self._ready_at = time.monotonic() + latency
+        self._fail = fail
+        self._result = result
+        self._cancelled = threading.Event()
+
+    def done(self) -> bool:
+        return self._cancelled.is_set() or time.monotonic() >= self._ready_at
+
+    def result(self):
+        if self._cancelled.wait(max(0.0, self._ready_at - time.monotonic())):
+            raise concurrent.futures.CancelledError()
+        if self._fail:
+            raise RuntimeError("stub Space error")
+        return self._result
+
+    def cancel(self) -> bool:
+        self._cancelled.set()
+        return True
+
+class StubGradio:
+    """بديل gradio_client.Client: يُستدعى كمصنع Client(client_id)"""
+
+    def __init__(self, latency: float, failure_rate: float, connect_latency: float, tryon_result: str, image_result: str):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.connect_latency = connect_latency
+        self.tryon_result = tryon_result
+        self.image_result = image_result
+
+    def __call__(self, client_id: str, *args, **kwargs):
+        time.sleep(self.connect_latency)
+        return StubClient(self, client_id)
+
+class StubClient:
+    def __init__(self, factory: StubGradio, client_id: str):
+        self.factory = factory
+        self.client_id = client_id
+
+    def submit(self, *args, api_name=None, **kwargs):
+        factory = self.factory
+        if "prompt" in kwargs:
+            # FLUX يعيد (مسار الصورة، البذرة)
+            result = (factory.image_result, random.randint(0, 2 ** 31))
+        else:
+            result = factory.tryon_result
+        latency = random.uniform(0.5, 1.5) * factory.latency
+        return StubJob(latency, random.random() < factory.failure_rate, result)
+
+    def predict(self, *args, **kwargs):
+        return self.submit(*args, **kwargs).result()
+
+class StubGemini:
+    """بديل GenerativeModel.generate_content"""
+
+    def __init__(self, latency: float, failure_rate: float):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def generate_content(self, prompt: str):
+        time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("stub Gemini error")
+        return SimpleNamespace(text="a detailed photo of the requested scene")
+
+# ---------------------------------------------------------------------------
+# التحديثات الاصطناعية
+# ---------------------------------------------------------------------------
+
+class UpdateFactory:
+    def __init__(self):
+        self._ids = iter(range(1, 1 << 62))
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "ar"}
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            **fields
+        }
+
+    def command(self, user_id: int, command: str) -> dict:
+        text = f"/{command}"
+        return {"update_id": next(self._ids), "message": self._message(
+            user_id, text=text, entities=[{"type": "bot_command", "offset": 0, "length": len(text)}]
+        )}
+
+    def text(self, user_id: int, text: str) -> dict:
+        return {"update_id": next(self._ids), "message": self._message(user_id, text=text)}
+
+    def photo(self, user_id: int) -> dict:
+        file_id = f"p{user_id}x{next(self._ids)}"
+        return {"update_id": next(self._ids), "message": self._message(user_id, photo=[
+            {"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 1707}
+        ])}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        bot_message = {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": STUB_BOT_ID, "is_bot": True, "first_name": "Graffiti"},
+            "text": "menu"
+        }
+        return {"update_id": next(self._ids), "callback_query": {
+            "id": str(next(self._ids)), "from": self._user(user_id),
+            "chat_instance": str(user_id), "data": data, "message": bot_message
+        }}
+
+FLOWS = {
+    "tryon_fast": lambda f, uid: [
+        f.command(uid, "start"), f.callback(uid, "start_tryon"), f.callback(uid, "select_model_g1_fast"),
+        f.photo(uid), f.photo(uid)
+    ],
+    "tryon_pro": lambda f, uid: [
+        f.command(uid, "start"), f.callback(uid, "start_tryon"), f.callback(uid, "select_model_g1_pro"),
+        f.callback(uid, random.choice(["garment_upper", "garment_lower", "garment_dress"])),
+        f.photo(uid), f.photo(uid)
+    ],
+    "generate_ar": lambda f, uid: [
+        f.command(uid, "start"), f.callback(uid, "start_image_gen"), f.text(uid, random.choice(ARABIC_PROMPTS))
+    ],
+    "generate_en": lambda f, uid: [
+        f.command(uid, "start"), f.callback(uid, "start_image_gen"), f.text(uid, random.choice(ENGLISH_PROMPTS))
+    ],
+    "browse": lambda f, uid: [
+        f.command(uid, "start"), f.callback(uid, "help"), f.callback(uid, "about"), f.callback(uid, "main_menu")
+    ],
+}
+
+def image_workers_peak_rss_mb(pool) -> float:
+    """مجموع أعلى RSS لعمال مجمع الصور (VmHWM)، قبل إيقافهم.
+    RUSAGE_CHILDREN لا يحسب إلا الأبناء المنتهين المنتظَرين، وعمال forkserver ليسوا أبناء هذه العملية أصلاً"""
+    total_kb = 0
+    for pid in pool.worker_pids():
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1)
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in FLOWS:
+            raise SystemExit(f"تدفق غير معروف: {name} (المتاح: {', '.join(FLOWS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+class ErrorCounter(logging.Handler):
+    """عدّ رسائل الأخطاء التي يسجلها البوت أثناء الاختبار"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+# ---------------------------------------------------------------------------
+# التشغيل
+# ---------------------------------------------------------------------------
+
+async def run_load(args, telegram_port: int, workdir: str) -> dict:
+    import bot
+    import aiohttp
+    from telegram import Update
+
+    tryon_result = os.path.join(workdir, "tryon_result.jpg")
+    image_result = os.path.join(workdir, "image_result.jpg")
+    with open(tryon_result, "wb") as f:
+        f.write(make_jpeg(768, 1024))
+    with open(image_result, "wb") as f:
+        f.write(make_jpeg(1024, 1024))
+
+    # استبدال الخدمات الخارجية
+    bot.Client = StubGradio(args.gradio_latency, args.gradio_failure_rate, args.connect_latency, tryon_result, image_result)
+    bot.gemini_model = StubGemini(args.gemini_latency, args.gemini_failure_rate)
+
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    app = bot.build_application()
+    # انتظار انتهاء معالجة كل تحديث يصل عبر getUpdates؛ Application يستخدم __slots__ فالتغليف
+    # يكون على معالج التحديثات الخاص بالبوت (قد ينتهي التحديث قبل أن يبدأ feed انتظاره)
+    processed = {}
+    processor = app.update_processor
+    do_process_update = processor.do_process_update
+
+    def completion(update_id):
+        return processed.setdefault(update_id, asyncio.get_running_loop().create_future())
+
+    async def tracked_do_process_update(update, coroutine):
+        try:
+            await do_process_update(update, coroutine)
+        finally:
+            waiter = completion(getattr(update, "update_id", None))
+            if not waiter.done():
+                waiter.set_result(None)
+
+    if args.transport == "polling":
+        processor.do_process_update = tracked_do_process_update
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    if args.transport == "polling":
+        await app.updater.start_polling(poll_interval=0.0, timeout=1)
+    http = aiohttp.ClientSession()
+
+    factory = UpdateFactory()
+    weights = parse_mix(args.mix)
+    names = list(weights)
+    flow_latencies = {name: [] for name in names}
+    update_latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def feed(data: dict):
+        started = time.perf_counter()
+        if args.transport == "polling":
+            # المسار الحقيقي: Bot API ثم getUpdates ثم فك JSON في Updater ثم update_processor
+            async with http.post(f"http://127.0.0.1:{telegram_port}/inject", json=data) as response:
+                update_id = (await response.json())["update_id"]
+            await completion(update_id)
+            processed.pop(update_id, None)
+        else:
+            update = Update.de_json(data, app.bot)
+            # نفس معالج التحديثات الذي يستخدمه polling/webhook (بما فيه ترتيب المحادثة)
+            await app.update_processor.process_update(update, app.process_update(update))
+        update_latencies.append(time.perf_counter() - started)
+
+    async def session(index: int):
+        async with semaphore:
+            name = random.choices(names, weights=[weights[n] for n in names])[0]
+            user_id = 10_000_000 + index
+            started = time.perf_counter()
+            for data in FLOWS[name](factory, user_id):
+                await feed(data)
+                if args.think_time:
+                    await asyncio.sleep(random.uniform(0, 2) * args.think_time)
+            flow_latencies[name].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(args.sessions)))
+    wall = time.perf_counter() - started
+
+    async with http.get(f"http://127.0.0.1:{telegram_port}/stats") as response:
+        telegram_stats = await response.json()
+    await http.close()
+
+    # قراءة ذاكرة عمال الصور قبل أن يوقفهم post_shutdown
+    workers_rss_mb = image_workers_peak_rss_mb(bot.image_process_pool)
+    if app.updater.running:
+        await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    await app.post_shutdown(app)
+    logging.getLogger().removeHandler(errors)
+
+    return {
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("json", "compare")
+        },
+        "wall_seconds": round(wall, 3),
+        "updates": len(update_latencies),
+        "updates_per_second": round(len(update_latencies) / wall, 2) if wall else None,
+        "update_latency": {
+            "p50": percentile(update_latencies, 0.5),
+            "p95": percentile(update_latencies, 0.95),
+            "p99": percentile(update_latencies, 0.99),
+        },
+        "flows": {
+            name: {
+                "count": len(values),
+                "p50": percentile(values, 0.5),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+            }
+            for name, values in flow_latencies.items()
+        },
+        "errors_logged": errors.count,
+        "telegram": telegram_stats,
+        # ru_maxrss بالكيلوبايت على لينكس
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_children_rss_mb": workers_rss_mb,
+    }
+
+def print_report(report: dict):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    print("=" * 60)
+    print(f"updates: {report['updates']}  wall: {report['wall_seconds']}s  "
+          f"throughput: {report['updates_per_second']} updates/s")
+    latency = report["update_latency"]
+    print(f"update latency  p50 {ms(latency['p50'])}  p95 {ms(latency['p95'])}  p99 {ms(latency['p99'])}")
+    print("-" * 60)
+    print(f"{'flow':<14}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in report["flows"].items():
+        print(f"{name:<14}{stats['count']:>7}{ms(stats['p50']):>10}{ms(stats['p95']):>10}{ms(stats['p99']):>10}")
+    print("-" * 60)
+    print(f"errors logged: {report['errors_logged']}  telegram failures: {report['telegram']['failures']}")
+    print(f"peak RSS: {report['peak_rss_mb']} MB (image workers {report['peak_children_rss_mb']} MB)")
+    print("=" * 60)
+
+def compare_reports(baseline: dict, current: dict):
+    """طباعة الفرق مع تقرير سابق"""
+    def delta(old, new):
+        if not old or new is None:
+            return "-"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"throughput: {baseline['updates_per_second']} -> {current['updates_per_second']} "
+          f"({delta(baseline['updates_per_second'], current['updates_per_second'])})")
+    for name, stats in current["flows"].items():
+        old = baseline.get("flows", {}).get(name)
+        if not old:
+            continue
+        print(f"{name:<14}p95 {delta(old['p95'], stats['p95']):>8}  p99 {delta(old['p99'], stats['p99']):>8}")
+    print(f"peak RSS: {baseline['peak_rss_mb']} -> {current['peak_rss_mb']} MB "
+          f"({delta(baseline['peak_rss_mb'], current['peak_rss_mb'])})")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the Graffiti AI bot")
+    parser.add_argument("--sessions", type=int, default=200, help="number of synthetic user sessions")
+    parser.add_argument("--concurrency", type=int, default=50, help="sessions running at the same time")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="flow weights, e.g. tryon_fast=3,browse=1")
+    parser.add_argument("--transport", choices=("polling", "direct"), default="polling",
+                        help="deliver updates through the stub's getUpdates, or straight to the update processor")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between a user's updates (s)")
+    parser.add_argument("--gradio-latency", type=float, default=1.0, help="mean Space prediction latency (s)")
+    parser.add_argument("--gradio-failure-rate", type=float, default=0.0)
+    parser.add_argument("--connect-latency", type=float, default=0.2, help="Client(...) construction latency (s)")
+    parser.add_argument("--gemini-latency", type=float, default=0.3, help="mean translation latency (s)")
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="mean Bot API latency (s)")
+    parser.add_argument("--telegram-failure-rate", type=float, default=0.0)
+    parser.add_argument("--photo-size", default="1280x1707", help="synthetic photo size WxH")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    photo_size = tuple(int(side) for side in args.photo_size.lower().split("x"))
+    workdir = tempfile.mkdtemp(prefix="graffiti_load_")
+    telegram_port = free_port()
+
+    # يجب ضبط البيئة قبل استيراد bot
+    os.environ.update({
+        "TELEGRAM_TOKEN": STUB_TOKEN,
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "stub"),
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{telegram_port}/bot",
+        "TELEGRAM_FILE_URL": f"http://127.0.0.1:{telegram_port}/file/bot",
+        "BOT_MODE": "polling",
+        "SESSION_BACKEND": "memory",
+        "METRICS_PORT": "0",
+        # منع طلبات الإيقاظ الحقيقية إلى Hugging Face أثناء الاختبار
+        "KEEPALIVE_ENABLED": "false",
+        "RESULT_CACHE_DIR": os.path.join(workdir, "results"),
+        "TRANSLATION_CACHE_DB": "",
+    })
+    logging.basicConfig(level=logging.WARNING)
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    stub = context.Process(
+        target=run_telegram_stub,
+        args=(telegram_port, args.telegram_latency, args.telegram_failure_rate, photo_size, ready),
+        daemon=True
+    )
+    stub.start()
+    try:
+        if not ready.wait(30):
+            raise SystemExit("❌ لم يبدأ خادم Bot API الوهمي")
+        report = asyncio.run(run_load(args, telegram_port, workdir))
+    finally:
+        stub.terminate()
+        stub.join()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare_reports(json.load(f), report)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+# مسودة قديمة غير مستخدمة: البوت يعمل من bot.py (انظر Procfile و railway.json)
+# وهذا الملف لا يُستورد من أي مكان ولا يُترجم أصلاً، لذا لم يُنقل إلى جلسة HTTP المشتركة
 
 import logging
 import asyncio